@@ -1,216 +1,241 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
 load_dotenv()
 
 from langgraph.graph import MessagesState
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from bs4 import BeautifulSoup
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, RemoveMessage
 
 from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import tools_condition
 from langgraph.prebuilt import ToolNode
 
 import asyncio
-
-from app.agents.utils.playwright_screenshot import capture_page_and_img_src
-
-from openai import OpenAI
-from app.agents.utils.images import encode_image
+from typing import Literal
+
+from langgraph.config import get_stream_writer
+from app.agents.utils.clone_pipeline import capture_into_workspace, fetch_images, generate_clone, write_clone
+
+from app.agents.utils.context_compaction import (
+    HISTORY_TOKEN_BUDGET,
+    compact_messages,
+    count_message_tokens,
+    file_context_messages,
+    split_for_summary,
+    summarize_messages,
+    summary_message,
+)
+from app.agents.utils.get_numbered_code_from_file import split_lines
+from app.agents.utils.llm_cache import canonical_langchain_messages, dump_ai_message, llm_cache, load_ai_message
+from app.agents.utils.llm_clients import get_chat_model
+from app.agents.utils.scheduler import llm_slots
+from app.agents.utils.tracing import span
+from app.agents.utils.patching import LineEdit, PatchError, apply_line_edits, apply_unified_diff
+from app.agents.utils.workspace import PAGE_CSS, PAGE_HTML, SCREENSHOT, get_workspace
+
+def _artifact_changed(*names: str):
+    """Tell the client (on the "custom" stream channel) which workspace files changed."""
+    writer = get_stream_writer()
+    for name in names:
+        writer({"type": "artifact", "name": name})
 
 @tool
-def write_html(html_code: str) -> str:
+async def write_html(html_code: str, config: RunnableConfig) -> str:
     """
     Write HTML code to the page.html file. This tool completely OVERWRITES the file.
     You will be given the current content of the file as context. 
     Make sure your new code includes all the necessary existing parts plus your changes.
     """
-    with open("../frontend/public/page.html", "w") as f:
-        f.write(html_code)
+    workspace = get_workspace(config)
+    with span("edit.write", file=PAGE_HTML, content_bytes=len(html_code)):
+        async with workspace.lock:
+            await workspace.write(PAGE_HTML, html_code)
+    _artifact_changed(PAGE_HTML)
     return "HTML code written to page.html"
 
 @tool
-def write_css(css_code: str) -> str:
+async def write_css(css_code: str, config: RunnableConfig) -> str:
     """
     Write CSS code to the assets/page.css file. This tool completely OVERWRITES the file.
     You will be given the current content of the file as context.
     Make sure your new code includes all the necessary existing parts plus your changes.
     """
-    with open("../frontend/public/page.css", "w") as f:
-        f.write(css_code)
+    workspace = get_workspace(config)
+    with span("edit.write", file=PAGE_CSS, content_bytes=len(css_code)):
+        async with workspace.lock:
+            await workspace.write(PAGE_CSS, css_code)
+    _artifact_changed(PAGE_CSS)
     return "CSS code written to page.css"
 
 @tool
-def get_screenshot_and_html_content_using_playwright(url: str) -> tuple[str, list[str]]:
+async def patch_file(
+    file_name: Literal["page.html", "page.css"],
+    config: RunnableConfig,
+    edits: list[LineEdit] | None = None,
+    diff: str | None = None,
+) -> str:
+    """
+    Change part of page.html or page.css without rewriting the whole file. Prefer this over write_html/write_css for targeted edits.
+    Pass either `edits` (line-range replacements using the line numbers shown in the context) or `diff` (unified-diff hunks against the current file), not both.
+    Line numbers always refer to the file as shown in the context, before this call. All changes are applied together or not at all.
+    """
+    if (edits is None) == (diff is None):
+        return "Pass exactly one of `edits` or `diff`."
+
+    def apply(code: str) -> str:
+        return apply_line_edits(code, edits) if edits is not None else apply_unified_diff(code, diff)
+
+    try:
+        with span("edit.patch", file=file_name):
+            patched = await get_workspace(config).update_text(file_name, apply)
+    except FileNotFoundError:
+        return f"{file_name} does not exist yet. Use write_html or write_css to create it."
+    except PatchError as e:
+        return f"Patch not applied, {file_name} is unchanged: {e}"
+    _artifact_changed(file_name)
+    return f"Patched {file_name}; it now has {len(split_lines(patched))} lines."
+
+@tool
+async def get_screenshot_and_html_content_using_playwright(url: str, config: RunnableConfig) -> tuple[str, list[str]]:
     """
     Get the screenshot and HTML content of a webpage using Playwright. After this tool call, you should use the tool call clone_and_write_html_to_file to generate the HTML.
     """
-    return asyncio.run(capture_page_and_img_src(url, "../frontend/public/screenshot-of-page-to-clone.png"))
+    scroll_policy = config.get("configurable", {}).get("scroll_policy")
+    result = await capture_into_workspace(url, get_workspace(config), scroll_policy, emit=get_stream_writer())
+    return result.trimmed_html, result.image_sources
 
 @tool
-def clone_and_write_html_to_file(trimmed_html_content: str) -> str:
+async def clone_and_write_html_to_file(trimmed_html_content: str, config: RunnableConfig) -> str:
     """
     Used to generate HTML after cloning, after the tool call get_screenshot_and_html_content_using_playwright. Take an existing image screenshot, and the trimmed down HTML as inputs and clone it by generating new HTML 
     and writing it to the file system. The CSS will be written to assets/page.css and the HTML to page.html.
     """
 
-    client = OpenAI()
-
-    # Getting the Base64 string
-    base64_image = encode_image("../frontend/public/screenshot-of-page-to-clone.png")
-
-    response = client.chat.completions.create(
-        model="o3",
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": """
-                ### SYSTEM
-You are "Pixel-Perfect Front-End", a senior web-platform engineer who specialises in
- * redesigning bloated, auto-generated pages into clean, semantic, WCAG-conformant HTML/CSS
- * matching the *visual* layout of the reference screenshot to within ±2 px for all major breakpoints
-
-When you reply you MUST:
-1. **Think step-by-step silently** ("internal reasoning"), then **output nothing but the final HTML inside a single fenced code block**.
-2. **Inline zero commentary** - the code block is the entire answer.
-3. Use **only system fonts** (font-stack: `Roboto, Arial, Helvetica, sans-serif`) and a single `<style>` block in the `<head>`.
-4. Avoid JavaScript unless explicitly asked; replicate all interactions with pure HTML/CSS where feasible.
-5. Preserve all outbound links exactly as provided in the RAW_HTML input.
-7. Ensure the layout is mobile-first responsive (Flexbox/Grid) and maintains the same visual hierarchy:  
-   e.g) **header ➔ main (logo, search box, buttons, promo) ➔ footer**.
-
-### USER CONTEXT
-You will receive two payloads:
-
-**SCREENSHOT** - Your primary reference for all visual styling, layout, colors, and fonts.
-**RAW_HTML** - The stripped, uglified DOM dump.
-
-### TASK
-1. **Your goal is to re-create the page from the SCREENSHOT as a single, clean HTML document.**
-2. **Use the RAW_HTML *only* to extract content like text, links (`href`), and accessibility attributes (`alt`, `aria-label`).**
-3. **Do NOT replicate the original's CSS or inline styles.** Create your own clean CSS in a `<style>` tag to match the screenshot's appearance.
-4. **Discard** every element from the RAW_HTML that is not visible in the screenshot.
-
-### OUTPUT FORMAT
-Return one fenced code block starting with <!DOCTYPE html> and ending with </html>
-No extra markdown, no explanations, no leading or trailing whitespace outside the code block.
-                 
-                 Here is the trimmed down HTML:
-                 {trimmed_html_content}
-            `"""},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    },
-                },
-            ],
-        }]
-    )
-
-    # 1. Get the raw HTML content from the LLM response
-    full_html = response.choices[0].message.content
-
-    # 2. Clean the response, removing markdown fences and extra whitespace
-    cleaned_html = full_html.strip()
-    if cleaned_html.startswith("```html"):
-        cleaned_html = cleaned_html[7:]
-    elif cleaned_html.startswith("```"):
-        cleaned_html = cleaned_html[3:]
+    workspace = get_workspace(config)
+    screenshot = await workspace.read(SCREENSHOT)
+    if screenshot is None:
+        return "No screenshot found. Call get_screenshot_and_html_content_using_playwright first."
 
-    if cleaned_html.endswith("```"):
-        cleaned_html = cleaned_html[:-3]
-    
-    cleaned_html = cleaned_html.strip()
-
-    # 3. Parse the CLEANED HTML
-    soup = BeautifulSoup(cleaned_html, 'html.parser')
-
-    # 4. Extract CSS and write to page.css
-    css_code = ""
-    style_tag = soup.find('style')
-    if style_tag:
-        css_code = style_tag.string or ''
-        style_tag.decompose()
-
-    if css_code:
-        with open("../frontend/public/page.css", "w") as f:
-            f.write(css_code.strip())
-        
-        # Add a link to the external stylesheet in the HTML
-        if soup.head:
-            link_tag = soup.new_tag("link", rel="stylesheet", href="page.css")
-            soup.head.append(link_tag)
-
-    # 5. Write the final HTML (without the inline style tag) to page.html
-    with open("../frontend/public/page.html", "w") as f:
-        f.write(str(soup))
+    emit = get_stream_writer()
+    # Download the page's images while the model works
+    (html_code, css_code), images = await asyncio.gather(
+        generate_clone(trimmed_html_content, screenshot, emit=emit, use_cache=config.get("configurable", {}).get("llm_cache", True)),
+        fetch_images(workspace, emit=emit),
+    )
+    await write_clone(workspace, html_code, css_code, images, emit=emit)
     
     return "Cloned webpage written to page.html and assets/page.css"
 
 # Toolsets
-creation_tools = [write_html, write_css]
+creation_tools = [write_html, write_css, patch_file]
 cloning_tools = [get_screenshot_and_html_content_using_playwright, clone_and_write_html_to_file]
 all_tools = creation_tools + cloning_tools
 
 # System message
-sys_msg = SystemMessage(content="You are a helpful software_developer_assistant tasked with writing and editing websites. When creating from scratch or editing, use the creation tools (`write_html`, `write_css`) to manage files separately. HTML goes in `page.html`, CSS in `assets/page.css`, and JavaScript in `assets/page.js`. When asked to clone a URL, use the cloning tools. The cloning process will automatically create `page.html` and `assets/page.css` for you. For any subsequent edits to the clone, use the creation tools to modify the appropriate file.")
+sys_msg = SystemMessage(content="You are a helpful software_developer_assistant tasked with writing and editing websites. When creating from scratch, use the creation tools (`write_html`, `write_css`) to manage files separately. For changes to existing files, use `patch_file` with line ranges or a unified diff instead of rewriting the whole file. HTML goes in `page.html`, CSS in `assets/page.css`, and JavaScript in `assets/page.js`. When asked to clone a URL, use the cloning tools. The cloning process will automatically create `page.html` and `assets/page.css` for you. For any subsequent edits to the clone, use the creation tools to modify the appropriate file.")
+
+ASSISTANT_MODEL = "o4-mini-2025-04-16"
 
 # Nodes
-def software_developer_assistant(state: MessagesState):
-   llm = ChatOpenAI(model="o4-mini-2025-04-16")
+# Each toolset is bound once per chat model. The model is looked up on every
+# call, since close_llm_clients() replaces it along with its HTTP client.
+_bound_llms: dict[bool, tuple] = {}
+
+def _assistant_llm(cloning: bool):
+   model = get_chat_model(ASSISTANT_MODEL)
+   bound = _bound_llms.get(cloning)
+   if bound is None or bound[0] is not model:
+       bound = _bound_llms[cloning] = (model, model.bind_tools(cloning_tools if cloning else creation_tools))
+   return bound[1]
+
+def _assistant_prompt(summary: str, history: list) -> list:
+   return [sys_msg] + ([summary_message(summary)] if summary else []) + history
+
+def is_clone_request(message: str) -> bool:
+   """Whether the router sends `message` to the cloning tools."""
+   message = message.lower()
+   return "clone" in message or "http" in message
+
+class AgentState(MessagesState):
+   # Running summary of the turns that were compacted out of `messages`
+   summary: str
+
+async def software_developer_assistant(state: AgentState, config: RunnableConfig):
    
    # Simple router based on user input
    user_input = state["messages"][-1].content.lower()
    
    # Let LangGraph manage the message state directly. This is more robust.
    messages = state["messages"]
-
-   if "clone" in user_input or "http" in user_input:
-       tools_for_llm = cloning_tools
-       # Just add the system message
-       messages_for_llm = [sys_msg] + messages
-   else:
-       tools_for_llm = creation_tools
-       # For edits, provide the current file content as context in a simpler way.
-       try:
-           with open("../frontend/public/page.html", "r") as f:
-               html_content = f.read()
-       except FileNotFoundError:
+   new_messages = []
+   files = {}
+
+   cloning = is_clone_request(user_input)
+   if not cloning:
+       # For edits, show the model the current files, unless it has already seen these exact versions.
+       workspace = get_workspace(config)
+       html_content = await workspace.read_text(PAGE_HTML)
+       if html_content is None:
            html_content = "<!-- The HTML file is currently empty. -->"
        
-       try:
-           with open("../frontend/public/page.css", "r") as f:
-               css_content = f.read()
-       except FileNotFoundError:
+       css_content = await workspace.read_text(PAGE_CSS)
+       if css_content is None:
            css_content = "/* The CSS file is currently empty. */"
 
-       context_message = HumanMessage(
-           content=f"""Here is the current state of the files you can edit:
-
-### page.html
-```html
-{html_content}
-```
-
-### page.css
-```css
-{css_content}
-```
-
-Please use this context to inform your edits. Remember that the write tools will overwrite the entire file.
-""",
-           name="context_provider"
-       )
-       # Add the system message and the context at the beginning.
-       messages_for_llm = [sys_msg, context_message] + messages
-       
-   llm_with_tools = llm.bind_tools(tools_for_llm)
-   return {"messages": [llm_with_tools.invoke(messages_for_llm)]}
+       files = {PAGE_HTML: html_content, PAGE_CSS: css_content}
+       new_messages = file_context_messages(messages, files)
+
+   update = {}
+   summary = state.get("summary", "")
+   messages_for_llm = _assistant_prompt(summary, compact_messages(messages + new_messages))
+   # Tokenizing a long history takes a while; keep it off the event loop.
+   tokens_before = await asyncio.to_thread(count_message_tokens, messages_for_llm)
+   if tokens_before > HISTORY_TOKEN_BUDGET:
+       older, recent = split_for_summary(messages)
+       if older:
+           with span("assistant.summarize", messages=len(older)):
+               summary = await summarize_messages(compact_messages(older), summary)
+           # Drop the summarized turns from the thread for good. A file context that goes
+           # with them is re-sent, so the model always sees the current files.
+           update["summary"] = summary
+           file_contexts = file_context_messages(recent, files)
+           new_messages = [RemoveMessage(id=message.id) for message in older] + file_contexts
+           messages_for_llm = _assistant_prompt(summary, compact_messages(recent + file_contexts))
+
+   tokens = tokens_before if "summary" not in update else await asyncio.to_thread(count_message_tokens, messages_for_llm)
+   get_stream_writer()({"type": "prompt_tokens", "tokens": tokens, "before_summarization": tokens_before})
+
+   llm_with_tools = _assistant_llm(cloning)
+   key = llm_cache.key(
+       ASSISTANT_MODEL,
+       canonical_langchain_messages(messages_for_llm),
+       tools=getattr(llm_with_tools, "kwargs", {}).get("tools"),
+   )
+   response, cache_status = await llm_cache.call(
+       "assistant",
+       key,
+       lambda: _invoke_assistant_llm(llm_with_tools, messages_for_llm, tokens),
+       dump_ai_message,
+       load_ai_message,
+       enabled=config.get("configurable", {}).get("llm_cache", True),
+   )
+   if cache_status == "hit" and isinstance(response.content, str) and response.content:
+       # Nothing was streamed for a cached reply, so send its text in one piece.
+       get_stream_writer()({"type": "delta", "text": response.content})
+   return {**update, "messages": new_messages + [response]}
+
+async def _invoke_assistant_llm(llm_with_tools, messages_for_llm: list, tokens: int) -> AIMessage:
+   async with llm_slots:
+       with span("assistant.llm", prompt_tokens=tokens) as llm_span:
+           response = await llm_with_tools.ainvoke(messages_for_llm)
+           usage = response.usage_metadata or {}
+           if usage:
+               llm_span.set(prompt_tokens=usage["input_tokens"], completion_tokens=usage["output_tokens"])
+   return response
 
 def build_workflow(checkpointer=None):
     # Graph
-    builder = StateGraph(MessagesState)
+    builder = StateGraph(AgentState)
 
     # Define nodes: these do the work
     builder.add_node("software_developer_assistant", software_developer_assistant)
@@ -0,0 +1,257 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import functools
+import tempfile
+import mimetypes
+from collections import OrderedDict
+from typing import Iterable
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+from PIL import Image
+
+# Where downloaded images are kept, and the URL path they are served under
+ASSET_DIR = os.getenv("ASSET_DIR", ".cache/assets")
+ASSET_URL_PREFIX = os.getenv("ASSET_URL_PREFIX", "/api/assets/")
+
+# Download limits
+ASSET_FETCH_CONCURRENCY = int(os.getenv("ASSET_FETCH_CONCURRENCY", "8"))
+ASSET_FETCH_TIMEOUT_SECONDS = float(os.getenv("ASSET_FETCH_TIMEOUT_SECONDS", "15"))
+ASSET_MAX_DOWNLOAD_BYTES = int(os.getenv("ASSET_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Images wider or taller than this are scaled down, and raster images larger
+# than ASSET_TRANSCODE_BYTES are re-encoded as WebP when that makes them smaller.
+ASSET_MAX_DIMENSION = int(os.getenv("ASSET_MAX_DIMENSION", "1600"))
+ASSET_TRANSCODE_BYTES = int(os.getenv("ASSET_TRANSCODE_BYTES", str(256 * 1024)))
+ASSET_QUALITY = int(os.getenv("ASSET_QUALITY", "80"))
+
+_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "image/svg+xml": ".svg",
+    "image/x-icon": ".ico",
+    "image/vnd.microsoft.icon": ".ico",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tiff",
+}
+# Formats served as they are: vector, animated or not worth decoding
+_PASSTHROUGH_TYPES = {"image/svg+xml", "image/gif", "image/x-icon", "image/vnd.microsoft.icon", "image/avif"}
+_ASSET_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+# Remembered URL -> asset name pairs, so repeated images are not downloaded again
+_KNOWN_URLS_LIMIT = 10000
+
+
+def resolve_image_urls(sources: Iterable[str], base_url: str) -> list[str]:
+    """The unique absolute http(s) URLs of `sources`, resolved against `base_url`; data: URIs are skipped."""
+    urls = {}
+    for source in sources:
+        source = source.strip()
+        if not source:
+            continue
+        url = urljoin(base_url, source).split("#", 1)[0]
+        if urlsplit(url).scheme in ("http", "https"):
+            urls[url] = None
+    return list(urls)
+
+
+def optimize_image(data: bytes, content_type: str) -> tuple[bytes, str]:
+    """
+    Scale raster images larger than ASSET_MAX_DIMENSION down and re-encode
+    them, or heavy ones, as WebP. Returns the new bytes and content type, or
+    the input unchanged when it is already fine or can't be decoded.
+    """
+    if content_type in _PASSTHROUGH_TYPES:
+        return data, content_type
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return data, content_type
+
+    with image:
+        oversized = max(image.size) > ASSET_MAX_DIMENSION
+        if not oversized and len(data) < ASSET_TRANSCODE_BYTES and content_type in ("image/png", "image/jpeg", "image/webp"):
+            return data, content_type
+
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        converted = image.convert("RGBA" if has_alpha else "RGB")
+        if oversized:
+            converted.thumbnail((ASSET_MAX_DIMENSION, ASSET_MAX_DIMENSION), Image.LANCZOS)
+        output = io.BytesIO()
+        # method=2 encodes about five times faster than the default for slightly larger files
+        converted.save(output, format="WEBP", quality=ASSET_QUALITY, method=2)
+
+    optimized = output.getvalue()
+    if not oversized and len(optimized) >= len(data):
+        return data, content_type
+    return optimized, "image/webp"
+
+
+class AssetStore:
+    """
+    Content-addressed image files, named after the SHA-256 of their bytes:
+
+        <directory>/<sha256><extension>
+
+    The same image reached through different URLs, or used by several pages,
+    is stored once. Files never change once written.
+    """
+
+    def __init__(self, directory: str = ASSET_DIR):
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        if not _ASSET_NAME.match(name):
+            raise ValueError(f"Invalid asset name: {name!r}")
+        return os.path.join(self.directory, name)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        name = hashlib.sha256(data).hexdigest() + _EXTENSIONS.get(content_type, ".img")
+        await asyncio.to_thread(self._write, self.path(name), data)
+        return name
+
+    async def read(self, name: str) -> bytes | None:
+        return await asyncio.to_thread(self._read, self.path(name))
+
+    @staticmethod
+    def _read(path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, data: bytes):
+        if os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class ImageFetcher:
+    """
+    Downloads images into an AssetStore through one bounded keep-alive
+    connection pool. Concurrent requests for one URL share a download, and
+    finished URLs are remembered; a URL that fails is left out of the results.
+    """
+
+    def __init__(self, store: AssetStore, concurrency: int = ASSET_FETCH_CONCURRENCY):
+        self.store = store
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client: httpx.AsyncClient | None = None
+        self._known: OrderedDict[str, str] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(ASSET_FETCH_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                headers={"Accept": "image/avif,image/webp,image/*;q=0.8"},
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_all(self, urls: Iterable[str]) -> dict[str, str]:
+        """Download `urls` in parallel. Returns url -> asset name for the ones that succeeded."""
+        urls = list(dict.fromkeys(urls))
+        names = await asyncio.gather(*[self.fetch(url) for url in urls], return_exceptions=True)
+        assets = {}
+        for url, name in zip(urls, names):
+            if isinstance(name, BaseException):
+                if isinstance(name, asyncio.CancelledError):
+                    raise name
+                print(f"[!] Image download failed for {url}: {name}")
+            else:
+                assets[url] = name
+        return assets
+
+    async def fetch(self, url: str) -> str:
+        if url in self._known:
+            self._known.move_to_end(url)
+            return self._known[url]
+        task = self._inflight.get(url)
+        if task is None:
+            # The download is its own task, so a caller giving up doesn't fail the others.
+            task = self._inflight[url] = asyncio.create_task(self._download(url))
+            task.add_done_callback(functools.partial(self._finished, url))
+        return await asyncio.shield(task)
+
+    def _finished(self, url: str, task: asyncio.Task):
+        del self._inflight[url]
+        if not task.cancelled() and task.exception() is None:
+            self._known[url] = task.result()
+            if len(self._known) > _KNOWN_URLS_LIMIT:
+                self._known.popitem(last=False)
+
+    async def _download(self, url: str) -> str:
+        async with self._semaphore:
+            async with self.client.stream("GET", url) as response:
+                if response.status_code >= 400:
+                    raise ValueError(f"HTTP {response.status_code}")
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if not content_type or content_type == "application/octet-stream":
+                    content_type = mimetypes.guess_type(urlsplit(url).path)[0] or ""
+                if not content_type.startswith("image/"):
+                    raise ValueError(f"not an image ({content_type or 'unknown type'})")
+
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > ASSET_MAX_DOWNLOAD_BYTES:
+                        raise ValueError(f"larger than {ASSET_MAX_DOWNLOAD_BYTES} bytes")
+                    chunks.append(chunk)
+
+        data, content_type = await asyncio.to_thread(optimize_image, b"".join(chunks), content_type)
+        return await self.store.put(data, content_type)
+
+
+def rewrite_image_sources(html: str, base_url: str, assets: dict[str, str], prefix: str = ASSET_URL_PREFIX) -> tuple[str, int]:
+    """
+    Point every <img> whose resolved `src` was downloaded (`assets` maps
+    absolute URL -> asset name) at the local copy. Their `srcset` is dropped,
+    since browsers would prefer it over the local `src`. Returns the new HTML
+    and how many images were rewritten.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    rewritten = 0
+    for img in soup.find_all("img"):
+        source = (img.get("src") or "").strip()
+        if not source:
+            continue
+        name = assets.get(urljoin(base_url, source).split("#", 1)[0])
+        if name is None:
+            continue
+        img["src"] = prefix + name
+        if img.has_attr("srcset"):
+            del img["srcset"]
+        rewritten += 1
+    if not rewritten:
+        return html, 0
+    return str(soup), rewritten
+
+
+asset_store = AssetStore()
+image_fetcher = ImageFetcher(asset_store)
@@ -0,0 +1,128 @@
+import os
+import time
+import asyncio
+from typing import AsyncIterator
+
+from app.agents.utils.clone_pipeline import (
+    capture_into_workspace,
+    discard_partial_clones,
+    fetch_images,
+    generate_clone,
+    write_clone,
+)
+from app.agents.utils.lazy_scroll import ScrollPolicy
+from app.agents.utils.tracing import start_trace
+from app.agents.utils.workspace import PAGE_HTML, SCREENSHOT, record_writes, workspaces
+
+# Per-batch stage concurrency. Captures and generations also share the global
+# capture and LLM pools with every other run.
+BATCH_CAPTURE_CONCURRENCY = int(os.getenv("BATCH_CAPTURE_CONCURRENCY", "2"))
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "50"))
+
+
+def batch_slot(batch_id: str, index: int) -> str:
+    """The workspace (thread id) holding the clone of the `index`-th URL of a batch."""
+    return f"batch-{batch_id}-{index:03d}"
+
+
+async def run_batch(
+    urls: list[str],
+    batch_id: str,
+    capture_concurrency: int = BATCH_CAPTURE_CONCURRENCY,
+    generation_concurrency: int = BATCH_GENERATION_CONCURRENCY,
+    scroll_policy: ScrollPolicy | None = None,
+    use_llm_cache: bool = True,
+) -> AsyncIterator[dict]:
+    """
+    Clone every URL in `urls` without going through the agent, yielding
+    progress events as they happen:
+
+        {"t": "url", "index", "url", "stage"}             capture, generate or write started
+        {"t": "result", "index", "url", "slot", "html", "ms"}
+                                                          the clone is in workspace `slot`,
+                                                          its page is served at `html`
+        {"t": "url_error", "index", "url", "stage", "error"}
+        {"t": "timing", "index", "name", "ms", ...}       a traced stage of one URL finished
+
+    Captures and generations are separate stages with their own limits, so
+    the next page is captured while earlier ones are still being generated.
+    A failed URL only ends its own pipeline. Closing the generator cancels
+    whatever is still running and removes the captures of pages it never
+    got to write.
+    """
+    capture_gate = asyncio.Semaphore(max(1, capture_concurrency))
+    generation_gate = asyncio.Semaphore(max(1, generation_concurrency))
+    events: asyncio.Queue[dict | None] = asyncio.Queue()
+
+    async def clone_one(index: int, url: str):
+        started = time.perf_counter()
+        # Each task has its own context, so this trace only sees this URL's spans.
+        trace = start_trace()
+        written = record_writes()
+
+        def emit(event: dict):
+            for timing in trace.drain():
+                events.put_nowait({**timing, "index": index})
+            events.put_nowait(event)
+
+        slot = batch_slot(batch_id, index)
+        workspace = workspaces.get(slot)
+        stage = "capture"
+        images = None
+
+        async def stop_images():
+            # Don't keep downloading for a page that won't be written, and
+            # collect the task's own failure so it isn't reported as unretrieved.
+            if images is not None:
+                images.cancel()
+                await asyncio.gather(images, return_exceptions=True)
+        try:
+            async with capture_gate:
+                emit({"t": "url", "index": index, "url": url, "stage": stage})
+                result = await capture_into_workspace(url, workspace, scroll_policy)
+
+            # Images download while the page waits for and goes through generation
+            images = asyncio.create_task(fetch_images(workspace))
+            async with generation_gate:
+                stage = "generate"
+                emit({"t": "url", "index": index, "url": url, "stage": stage})
+                html_code, css_code = await generate_clone(
+                    result.trimmed_html, await workspace.read(SCREENSHOT), use_cache=use_llm_cache
+                )
+
+            stage = "write"
+            await write_clone(workspace, html_code, css_code, await images)
+            emit({
+                "t": "result",
+                "index": index,
+                "url": url,
+                "slot": slot,
+                "html": f"/api/workspaces/{slot}/{PAGE_HTML}",
+                "ms": round((time.perf_counter() - started) * 1000),
+            })
+        except asyncio.CancelledError:
+            await stop_images()
+            if removed := await discard_partial_clones(written):
+                print(f"[+] Batch {batch_id}: cancelled during {stage}, removed {', '.join(removed)}")
+            raise
+        except Exception as e:
+            print(f"[!] Batch {batch_id}: {url} failed during {stage}: {e}")
+            await stop_images()
+            emit({"t": "url_error", "index": index, "url": url, "stage": stage, "error": str(e)})
+        finally:
+            events.put_nowait(None)
+
+    tasks = [asyncio.create_task(clone_one(index, url)) for index, url in enumerate(urls)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await events.get()
+            if event is None:
+                remaining -= 1
+            else:
+                yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright, Error as PlaywrightError
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+
+async def _get_browser(p):
+    """
+    Connect to Browserless when credentials are available;
+    otherwise launch a local headless browser.
+    """
+    token = os.getenv("BROWSERLESS_API_TOKEN")
+    ws_endpoint = os.getenv("BROWSERLESS_WS_ENDPOINT")
+
+    if not ws_endpoint and token:
+        ws_endpoint = f"wss://chrome.browserless.io?token={token}"
+
+    if ws_endpoint:
+        print(f"[+] Connecting to Browserless...")
+        return await p.chromium.connect_over_cdp(ws_endpoint)
+
+    print("[!] No Browserless credentials found - launching local headless Chromium.")
+    print("[!] To use Browserless, set BROWSERLESS_API_TOKEN in a .env file.")
+    return await p.chromium.launch(headless=True)
+
+
+class _PooledBrowser:
+    def __init__(self, browser=None):
+        self.browser = browser
+        self.pages_served = 0
+
+    def is_healthy(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    A process-wide pool of warm browsers that hands out fresh, isolated
+    BrowserContexts.
+
+    The browsers live on a dedicated event loop thread, so Playwright's protocol
+    traffic stays off the request loop and callers on any loop (FastAPI's own, or
+    one made by asyncio.run in a script) share the same browsers. At most `size`
+    contexts are open at once, which caps Chromium memory no matter how many
+    captures are in flight. A browser is recycled after serving `max_pages`
+    contexts, or as soon as it is found disconnected.
+    """
+
+    def __init__(self, size: int | None = None, max_pages: int | None = None):
+        self.size = size or int(os.getenv("BROWSER_POOL_SIZE", "2"))
+        self.max_pages = max_pages or int(os.getenv("BROWSER_POOL_MAX_PAGES", "50"))
+
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._playwright = None
+        self._idle: asyncio.Queue | None = None
+        self._start_lock: asyncio.Lock | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="browser-pool", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    async def run(self, coro):
+        """Run `coro` on the pool's loop and await its result from the caller's loop."""
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def start(self):
+        """Launch the driver and warm every browser in the pool."""
+        await self.run(self._start())
+
+    async def close(self):
+        """Close every browser and the driver, then stop the pool's loop."""
+        if self._loop is None:
+            return
+        await self.run(self._close())
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        await asyncio.to_thread(thread.join)
+        loop.close()
+
+    async def _start(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            self._playwright = await async_playwright().start()
+            idle = asyncio.Queue()
+
+            launched = await asyncio.gather(
+                *[_get_browser(self._playwright) for _ in range(self.size)],
+                return_exceptions=True,
+            )
+            for browser in launched:
+                if isinstance(browser, BaseException):
+                    # Keep the slot; it will be relaunched on first use.
+                    print(f"[!] Failed to warm pooled browser: {browser}")
+                    browser = None
+                idle.put_nowait(_PooledBrowser(browser))
+            self._idle = idle
+            print(f"[+] Browser pool ready ({self.size} browsers)")
+
+    async def _close(self):
+        if self._idle is None:
+            return
+        # Wait for in-flight captures to hand their browsers back.
+        slots = [await self._idle.get() for _ in range(self.size)]
+        await asyncio.gather(*[self._discard(slot) for slot in slots])
+        await self._playwright.stop()
+        self._playwright = None
+        self._idle = None
+        self._start_lock = None
+
+    async def _discard(self, slot: _PooledBrowser):
+        if slot.browser is None:
+            return
+        try:
+            await slot.browser.close()
+        except PlaywrightError:
+            # The browser has already crashed or disconnected.
+            pass
+
+    @asynccontextmanager
+    async def context(self, **context_options):
+        """
+        Borrow a browser and yield a new BrowserContext on it. Must be entered on
+        the pool's loop, i.e. from a coroutine passed to `run`.
+        """
+        await self._start()
+        slot = await self._idle.get()
+        context = None
+        try:
+            if not slot.is_healthy():
+                # Health check: relaunch browsers that crashed or were recycled.
+                await self._discard(slot)
+                slot = _PooledBrowser(await _get_browser(self._playwright))
+
+            context = await slot.browser.new_context(**context_options)
+            yield context
+        finally:
+            try:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except PlaywrightError:
+                        pass
+                    slot.pages_served += 1
+
+                if not slot.is_healthy() or slot.pages_served >= self.max_pages:
+                    await self._discard(slot)
+                    slot = _PooledBrowser()
+            finally:
+                # Even a capture cancelled mid-cleanup hands its slot back, or the
+                # pool would shrink for good and close() would wait on it forever.
+                self._idle.put_nowait(slot)
+
+
+browser_pool = BrowserPool()
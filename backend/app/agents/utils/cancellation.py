@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from app.agents.utils.metrics import Counter
+
+T = TypeVar("T")
+
+runs_cancelled = Counter("runs_cancelled_total", "Runs stopped because their client went away", ("route",))
+cancelled_seconds = Counter(
+    "runs_cancelled_seconds_total", "Time abandoned runs had been running when they were stopped", ("route",)
+)
+
+
+# Cancelled runs still unwinding; the event loop only keeps weak references to tasks
+_stopping: set[asyncio.Task] = set()
+
+
+class ClientDisconnected(Exception):
+    """The client of a streamed response went away before the run finished."""
+
+
+async def wait_for_disconnect(receive: Callable[[], Awaitable[dict]]):
+    """Return once the ASGI server reports that the client disconnected."""
+    # The request body has already been read, so the next message is the disconnect.
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def relay_until_disconnect(
+    receive: Callable[[], Awaitable[dict]], events: AsyncIterator[T]
+) -> AsyncIterator[T]:
+    """
+    Yield the items of `events`, produced in a task of their own, until the
+    client disconnects. A disconnect cancels that task, and with it whatever
+    it is awaiting (graph nodes, browser captures, model calls), then raises
+    ClientDisconnected. Without this, a run only notices a closed connection
+    when it next writes to it, which can be minutes into a model call.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async with aclosing(events) as items:
+                async for item in items:
+                    queue.put_nowait(item)
+        finally:
+            queue.put_nowait(done)
+
+    producer = asyncio.create_task(pump())
+    disconnected = asyncio.create_task(wait_for_disconnect(receive))
+    try:
+        while True:
+            next_item = asyncio.ensure_future(queue.get())
+            await asyncio.wait({next_item, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_item.done():
+                next_item.cancel()
+                raise ClientDisconnected()
+            item = next_item.result()
+            if item is done:
+                break
+            yield item
+        # Re-raise whatever ended the run early
+        await producer
+    finally:
+        disconnected.cancel()
+        if not producer.done():
+            producer.cancel()
+            # The run cleans up (browser contexts, partial files) as it unwinds. A
+            # second cancel would cut that short, and gather() would pass on the one
+            # the server sends us, so wait without ever cancelling it again.
+            _stopping.add(producer)
+            producer.add_done_callback(_stopping.discard)
+            await asyncio.wait({producer})
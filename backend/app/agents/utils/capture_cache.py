@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from dataclasses import asdict, replace
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+
+from app.agents.utils.dom_snapshot import CAPTURE_SNAPSHOT
+from app.agents.utils.lazy_scroll import ScrollPolicy
+from app.agents.utils.metrics import Counter, Gauge
+from app.agents.utils.playwright_screenshot import CaptureResult, DEFAULT_VIEWPORT, capture_page
+from app.agents.utils.request_blocking import request_blocker
+from app.agents.utils.scheduler import capture_slots
+from app.agents.utils.single_flight import SingleFlight
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of `url` so trivially different spellings share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    # The fragment never reaches the server, so it can't change the capture.
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def capture_options(scroll_policy: ScrollPolicy | None) -> dict:
+    """Everything besides the URL that changes what a capture produces."""
+    return {
+        "viewport": DEFAULT_VIEWPORT,
+        "scroll": asdict(scroll_policy or ScrollPolicy()),
+        "snapshot": CAPTURE_SNAPSHOT,
+        "profile": request_blocker.profile.name,
+    }
+
+
+class CaptureCache:
+    """
+    On-disk cache of capture results, one directory per entry:
+
+        <directory>/<sha256 of url + options>/entry.json
+        <directory>/<sha256 of url + options>/screenshot.png
+
+    Entries expire after `ttl_seconds`. An expired entry that recorded an ETag or
+    Last-Modified header is revalidated with a conditional GET and served again
+    on a 304. The directory is kept under `max_bytes` by evicting the least
+    recently used entries, tracked through the mtime of entry.json. Disk work
+    runs in worker threads, and the directory is only scanned once it may be
+    over budget.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        ttl_seconds: float | None = None,
+        max_bytes: int | None = None,
+        revalidate: bool | None = None,
+    ):
+        self.directory = directory or os.getenv("CAPTURE_CACHE_DIR", ".cache/captures")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CAPTURE_CACHE_TTL_SECONDS", "3600"))
+        self.max_bytes = max_bytes or int(os.getenv("CAPTURE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        if revalidate is None:
+            revalidate = os.getenv("CAPTURE_CACHE_REVALIDATE", "1") == "1"
+        self.revalidate = revalidate
+        # Size of the directory as of the last scan plus what has been stored
+        # since; None until the first put scans it.
+        self._bytes: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def key(self, url: str, options: dict) -> str:
+        payload = json.dumps({"url": normalize_url(url), "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _read_entry(self, key: str) -> dict | None:
+        try:
+            with open(os.path.join(self._entry_dir(key), "entry.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_entry(self, key: str, entry: dict):
+        entry_dir = self._entry_dir(key)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, os.path.join(entry_dir, "entry.json"))
+
+    def _copy_screenshot(self, key: str, image_path: str) -> bool:
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        try:
+            shutil.copyfile(os.path.join(self._entry_dir(key), "screenshot.png"), image_path)
+            # Mark the entry as recently used for LRU eviction.
+            os.utime(os.path.join(self._entry_dir(key), "entry.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def get(self, url: str, options: dict, image_path: str) -> tuple[CaptureResult, str] | None:
+        """
+        Serve a cached capture, copying its screenshot to `image_path`.
+        Returns the result and "hit" or "revalidated", or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        key = self.key(url, options)
+        entry = await asyncio.to_thread(self._read_entry, key)
+        if entry is None:
+            return None
+
+        status = "hit"
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            if not (self.revalidate and entry["validators"] and await self._not_modified(url, entry["validators"])):
+                return None
+            entry["created_at"] = time.time()
+            await asyncio.to_thread(self._write_entry, key, entry)
+            status = "revalidated"
+
+        if not await asyncio.to_thread(self._copy_screenshot, key, image_path):
+            return None
+
+        result = CaptureResult(
+            trimmed_html=entry["trimmed_html"],
+            image_sources=entry["image_sources"],
+            validators=entry["validators"],
+            base_url=entry.get("base_url") or url,
+        )
+        return result, status
+
+    async def put(self, url: str, options: dict, image_path: str, result: CaptureResult):
+        if not self.enabled:
+            return
+
+        key = self.key(url, options)
+        entry = {
+            "url": normalize_url(url),
+            "options": options,
+            "created_at": time.time(),
+            "trimmed_html": result.trimmed_html,
+            "image_sources": result.image_sources,
+            "validators": result.validators,
+            "base_url": result.base_url,
+        }
+
+        if self._bytes is None:
+            self._bytes = await asyncio.to_thread(self._size)
+        self._bytes += await asyncio.to_thread(self._store, key, entry, image_path)
+        if self._bytes > self.max_bytes:
+            self._bytes = await asyncio.to_thread(self._evict)
+
+    def _store(self, key: str, entry: dict, image_path: str) -> int:
+        """Write the entry for `key`. Returns how much the directory grew, in bytes."""
+        # Build the entry next to its final location, then swap it in whole.
+        os.makedirs(self.directory, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(dir=self.directory, prefix=".staging-")
+        shutil.copyfile(image_path, os.path.join(staging_dir, "screenshot.png"))
+        with open(os.path.join(staging_dir, "entry.json"), "w") as f:
+            json.dump(entry, f)
+        added = self._dir_size(staging_dir)
+
+        entry_dir = self._entry_dir(key)
+        removed = self._dir_size(entry_dir)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # A concurrent capture of the same page won the race; keep theirs.
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return -removed
+        return added - removed
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        try:
+            return sum(e.stat().st_size for e in os.scandir(path))
+        except FileNotFoundError:
+            return 0
+
+    def _entry_dirs(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.directory, name))
+        ]
+
+    def _size(self) -> int:
+        return sum(self._dir_size(entry_dir) for entry_dir in self._entry_dirs())
+
+    def _evict(self) -> int:
+        """Remove least recently used entries until the directory fits. Returns its new size."""
+        entries = []
+        total = 0
+        for entry_dir in self._entry_dirs():
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(entry_dir))
+                last_used = os.stat(os.path.join(entry_dir, "entry.json")).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((last_used, size, entry_dir))
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+        return total
+
+    async def _not_modified(self, url: str, validators: dict[str, str]) -> bool:
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last-modified" in validators:
+            headers["If-Modified-Since"] = validators["last-modified"]
+        try:
+            async with httpx.AsyncClient(follow_redirects=True, timeout=5) as client:
+                # Only the status matters, so don't download a changed body.
+                async with client.stream("GET", url, headers=headers) as response:
+                    return response.status_code == 304
+        except httpx.HTTPError:
+            return False
+
+
+capture_cache = CaptureCache()
+
+# Concurrent misses for the same page share one browser capture.
+capture_flights: SingleFlight[tuple[CaptureResult, bytes]] = SingleFlight()
+
+capture_requests = Counter(
+    "capture_requests_total", "Captures requested, by how they were served or \"error\"", ("status",)
+)
+Gauge("capture_flights_in_progress", "Distinct pages being captured right now", callback=lambda: len(capture_flights))
+
+
+async def _capture_once(url: str, options: dict, scroll_policy: ScrollPolicy | None) -> tuple[CaptureResult, bytes]:
+    # The flight outlives whichever caller started it, so it captures into its own directory.
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        image_path = os.path.join(scratch_dir, "screenshot.png")
+        # Only real browser work counts against the capture pool.
+        async with capture_slots:
+            result = await capture_page(url, image_path, scroll_policy)
+        await capture_cache.put(url, options, image_path, result)
+        return result, await asyncio.to_thread(_read_bytes, image_path)
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_bytes(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def cached_capture(
+    url: str, image_path: str, scroll_policy: ScrollPolicy | None = None
+) -> tuple[CaptureResult, str]:
+    """
+    Capture `url`, serving it from the capture cache when possible.
+    Returns the result and the cache status: "hit", "revalidated", "miss", or
+    "coalesced" when it joined a capture of the same page already under way.
+    Failed captures are counted under "error".
+    """
+    options = capture_options(scroll_policy)
+
+    try:
+        cached = await capture_cache.get(url, options, image_path)
+        if cached is not None:
+            capture_requests.inc(status=cached[1])
+            return cached
+
+        key = capture_cache.key(url, options)
+        (result, screenshot), shared = await capture_flights.run(
+            key, lambda: _capture_once(url, options, scroll_policy)
+        )
+    except Exception:
+        capture_requests.inc(status="error")
+        raise
+    status = "coalesced" if shared else "miss"
+    capture_requests.inc(status=status)
+    if shared:
+        print(f"[+] Joined the capture of {url} already in progress")
+
+    await asyncio.to_thread(_write_bytes, image_path, screenshot)
+    # Every caller gets its own copy to mutate.
+    return replace(result, image_sources=list(result.image_sources), validators=dict(result.validators)), status
@@ -0,0 +1,110 @@
+import os
+import re
+import asyncio
+import tempfile
+
+from app.agents.utils.capture_cache import cached_capture, capture_cache, capture_options
+from app.agents.utils.lazy_scroll import ScrollPolicy
+from app.agents.utils.metrics import Counter
+from app.agents.utils.playwright_screenshot import CaptureResult
+from app.agents.utils.tracing import span
+
+# Start capturing URLs from the user's message before the model asks for them
+CAPTURE_PREFETCH = os.getenv("CAPTURE_PREFETCH", "1") == "1"
+CAPTURE_PREFETCH_MAX_URLS = int(os.getenv("CAPTURE_PREFETCH_MAX_URLS", "1"))
+
+_URL_PATTERN = re.compile(r"https?://[^\s<>\"'`]+")
+# Punctuation that ends a sentence rather than the URL
+_TRAILING = ".,;:!?)]}"
+
+prefetches = Counter("capture_prefetches_total", "Speculative captures, by what became of them", ("outcome",))
+
+
+def extract_urls(text: str, limit: int) -> list[str]:
+    """The first `limit` distinct http(s) URLs in `text`."""
+    urls = []
+    for match in _URL_PATTERN.finditer(text):
+        url = match.group(0).rstrip(_TRAILING)
+        if url not in urls:
+            urls.append(url)
+        if len(urls) >= limit:
+            break
+    return urls
+
+
+class CapturePrefetcher:
+    """
+    Captures the URLs in a chat message in the background while the model is
+    still deciding to call the capture tool, which then takes the finished
+    or in-flight capture instead of starting its own.
+
+    Prefetches go through cached_capture, so they share the capture pool and
+    coalesce with any other capture of the same page. The request that
+    started them discards whatever the tool didn't take.
+    """
+
+    def __init__(self, enabled: bool = CAPTURE_PREFETCH, max_urls: int = CAPTURE_PREFETCH_MAX_URLS):
+        self.enabled = enabled
+        self.max_urls = max_urls
+        # (thread_id, capture cache key) -> capture of that page
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+
+    def _key(self, thread_id: str, url: str, scroll_policy: ScrollPolicy | None) -> tuple[str, str]:
+        return thread_id, capture_cache.key(url, capture_options(scroll_policy))
+
+    def start(self, thread_id: str, message: str, scroll_policy: ScrollPolicy | None = None) -> list[tuple[str, str]]:
+        """Start capturing the URLs in `message`. Returns the keys to discard() once the request is over."""
+        if not self.enabled:
+            return []
+        keys = []
+        for url in extract_urls(message, self.max_urls):
+            key = self._key(thread_id, url, scroll_policy)
+            if key in self._tasks:
+                continue
+            self._tasks[key] = asyncio.create_task(self._capture(url, scroll_policy))
+            keys.append(key)
+            print(f"[+] Prefetching capture of {url}")
+        return keys
+
+    async def _capture(self, url: str, scroll_policy: ScrollPolicy | None) -> tuple[CaptureResult, bytes]:
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            image_path = os.path.join(scratch_dir, "screenshot.png")
+            with span("capture.prefetch") as prefetch_span:
+                result, cache_status = await cached_capture(url, image_path, scroll_policy)
+                prefetch_span.set(cache=cache_status)
+            with open(image_path, "rb") as f:
+                return result, f.read()
+
+    async def take(self, thread_id: str, url: str, scroll_policy: ScrollPolicy | None = None) -> tuple[CaptureResult, bytes] | None:
+        """
+        Wait for the prefetched capture of `url`, if there is one. Returns its
+        result and screenshot, or None when there is none or it failed.
+        """
+        task = self._tasks.pop(self._key(thread_id, url, scroll_policy), None)
+        if task is None:
+            return None
+        try:
+            captured = await task
+        except Exception as e:
+            prefetches.inc(outcome="failed")
+            print(f"[!] Prefetched capture of {url} failed, capturing again: {e}")
+            return None
+        prefetches.inc(outcome="used")
+        return captured
+
+    def discard(self, keys: list[tuple[str, str]]):
+        """Cancel the prefetches in `keys` that were never taken."""
+        for key in keys:
+            task = self._tasks.pop(key, None)
+            if task is None:
+                continue
+            if task.done():
+                prefetches.inc(outcome="unused")
+                if not task.cancelled():
+                    task.exception()  # Retrieved, so a failure isn't logged as unhandled
+            else:
+                prefetches.inc(outcome="cancelled")
+                task.cancel()
+
+
+capture_prefetcher = CapturePrefetcher()
@@ -0,0 +1,184 @@
+import os
+import time
+import threading
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+# Which checkpoint backend holds conversation state: memory, sqlite or postgres
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory").lower()
+
+# In-memory backend limits
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+CHECKPOINT_IDLE_TTL_SECONDS = float(os.getenv("CHECKPOINT_IDLE_TTL_SECONDS", "3600"))
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))
+
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", ".cache/checkpoints.sqlite")
+CHECKPOINT_POSTGRES_URL = os.getenv("CHECKPOINT_POSTGRES_URL", "")
+CHECKPOINT_POSTGRES_POOL_SIZE = int(os.getenv("CHECKPOINT_POSTGRES_POOL_SIZE", "10"))
+
+
+class ActiveThreads:
+    """The threads with a run in progress, counted so concurrent runs of one thread nest."""
+
+    def __init__(self):
+        self._runs: Counter[str] = Counter()
+
+    @contextmanager
+    def running(self, thread_id: str) -> Iterator[None]:
+        self._runs[thread_id] += 1
+        try:
+            yield
+        finally:
+            self._runs[thread_id] -= 1
+            if not self._runs[thread_id]:
+                del self._runs[thread_id]
+
+    def __contains__(self, thread_id: str) -> bool:
+        return thread_id in self._runs
+
+
+active_threads = ActiveThreads()
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    An InMemorySaver that forgets whole threads: the least recently used ones
+    beyond `max_threads` or once the serialized checkpoints pass `max_bytes`,
+    and any thread idle for longer than `ttl_seconds`. The thread being written
+    and threads in `active` are never evicted, so a run in progress keeps its
+    history and workspace. `on_evict(thread_id)` is called for every evicted
+    thread.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = CHECKPOINT_MAX_THREADS,
+        ttl_seconds: float = CHECKPOINT_IDLE_TTL_SECONDS,
+        max_bytes: int = CHECKPOINT_MAX_BYTES,
+        on_evict: Callable[[str], None] | None = None,
+        active: ActiveThreads = active_threads,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.active = active
+        # thread_id -> last access time, least recently used first
+        self._last_access: OrderedDict[str, float] = OrderedDict()
+        self._thread_bytes: dict[str, int] = {}
+        self.total_bytes = 0
+        self._lock = threading.RLock()
+
+    def _touch(self, thread_id: str):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _add_bytes(self, thread_id: str, size: int):
+        self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + size
+        self.total_bytes += size
+
+    def _evict(self, keep: str):
+        now = time.monotonic()
+        for thread_id, last_access in list(self._last_access.items()):
+            if thread_id == keep or thread_id in self.active:
+                continue
+            over_limits = len(self._last_access) > self.max_threads or self.total_bytes > self.max_bytes
+            if not over_limits and now - last_access <= self.ttl_seconds:
+                # Everything after this is more recent still.
+                break
+            self.delete_thread(thread_id)
+            if self.on_evict is not None:
+                self.on_evict(thread_id)
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            saved = super().put(config, checkpoint, metadata, new_versions)
+
+            size = sum(
+                len(self.blobs[(thread_id, checkpoint_ns, channel, version)][1])
+                for channel, version in new_versions.items()
+            )
+            serialized_checkpoint, serialized_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            size += len(serialized_checkpoint[1]) + len(serialized_metadata[1])
+            self._add_bytes(thread_id, size)
+
+            self._touch(thread_id)
+            self._evict(keep=thread_id)
+            return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            outer_key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+            existing = set(self.writes.get(outer_key, ()))
+            super().put_writes(config, writes, task_id, task_path)
+
+            self._add_bytes(thread_id, sum(
+                len(value[2][1]) for key, value in self.writes[outer_key].items() if key not in existing
+            ))
+            self._touch(thread_id)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            super().delete_thread(thread_id)
+            self.total_bytes -= self._thread_bytes.pop(thread_id, 0)
+            self._last_access.pop(thread_id, None)
+
+
+@asynccontextmanager
+async def open_checkpointer(
+    backend: str = CHECKPOINTER, on_evict: Callable[[str], None] | None = None
+) -> AsyncIterator[BaseCheckpointSaver]:
+    """
+    The checkpoint saver for `backend`, open for the duration of the context.
+    `on_evict` only applies to the in-memory backend, the others keep threads
+    until they are deleted.
+    """
+    if backend == "memory":
+        yield BoundedMemorySaver(on_evict=on_evict)
+
+    elif backend == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        os.makedirs(os.path.dirname(CHECKPOINT_SQLITE_PATH) or ".", exist_ok=True)
+        async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_SQLITE_PATH) as saver:
+            await saver.setup()
+            print(f"[+] Checkpoints stored in SQLite at {CHECKPOINT_SQLITE_PATH}")
+            yield saver
+
+    elif backend == "postgres":
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+        if not CHECKPOINT_POSTGRES_URL:
+            raise ValueError("CHECKPOINT_POSTGRES_URL must be set to use the postgres checkpointer")
+        async with AsyncConnectionPool(
+            CHECKPOINT_POSTGRES_URL,
+            max_size=CHECKPOINT_POSTGRES_POOL_SIZE,
+            # Settings the saver relies on, as in AsyncPostgresSaver.from_conn_string
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            open=False,
+        ) as pool:
+            saver = AsyncPostgresSaver(conn=pool)
+            await saver.setup()
+            print(f"[+] Checkpoints stored in Postgres (pool of up to {CHECKPOINT_POSTGRES_POOL_SIZE} connections)")
+            yield saver
+
+    else:
+        raise ValueError(f"Unknown checkpointer backend: {backend!r}")
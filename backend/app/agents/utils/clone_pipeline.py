@@ -0,0 +1,395 @@
+import os
+import json
+import asyncio
+import tempfile
+from typing import Any, Callable
+
+from bs4 import BeautifulSoup
+
+from app.agents.utils.assets import image_fetcher, resolve_image_urls, rewrite_image_sources
+from app.agents.utils.capture_cache import cached_capture
+from app.agents.utils.capture_prefetch import capture_prefetcher
+from app.agents.utils.images import prepare_screenshot_for_upload
+from app.agents.utils.lazy_scroll import ScrollPolicy
+from app.agents.utils.llm_cache import canonical_chat_messages, dump_chat_completion, llm_cache, load_chat_completion
+from app.agents.utils.llm_clients import get_openai_client
+from app.agents.utils.playwright_screenshot import CaptureResult
+from app.agents.utils.sections import (
+    CLONE_SECTION_CONCURRENCY,
+    CLONE_SECTIONED,
+    Section,
+    merge_css,
+    page_title,
+    plan_sections,
+    stitch_sections,
+)
+from app.agents.utils.scheduler import llm_slots
+from app.agents.utils.tracing import span
+from app.agents.utils.token_budget import CLONE_HTML_TOKEN_BUDGET, reduce_html_to_token_budget
+from app.agents.utils.workspace import IMAGE_MANIFEST, PAGE_CSS, PAGE_HTML, SCREENSHOT, Workspace, workspaces
+
+# The capture and generation steps of a clone, shared by the agent's cloning
+# tools and the batch endpoint. Progress goes to an optional `emit` callback
+# taking event dicts, e.g. LangGraph's stream writer.
+
+
+def _no_emit(event: dict):
+    pass
+
+
+async def capture_into_workspace(
+    url: str,
+    workspace: Workspace,
+    scroll_policy: ScrollPolicy | None = None,
+    emit: Callable[[dict], None] = _no_emit,
+) -> CaptureResult:
+    """
+    Capture `url` (through the capture cache, or the prefetch started for
+    the workspace's thread) and store its screenshot in `workspace`.
+    """
+    prefetched = await capture_prefetcher.take(workspace.thread_id, url, scroll_policy)
+    if prefetched is not None:
+        result, screenshot = prefetched
+        cache_status = "prefetched"
+    else:
+        # Capture into a private scratch file, then publish it to the workspace
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            image_path = os.path.join(scratch_dir, SCREENSHOT)
+            with span("capture") as capture_span:
+                result, cache_status = await cached_capture(url, image_path, scroll_policy)
+                capture_span.set(cache=cache_status)
+            with open(image_path, "rb") as f:
+                screenshot = f.read()
+    await workspace.write(SCREENSHOT, screenshot)
+    emit({"type": "artifact", "name": SCREENSHOT})
+
+    # Remember the page's images so they can be downloaded for the clone
+    await workspace.write(IMAGE_MANIFEST, json.dumps({
+        "base_url": result.base_url or url,
+        "urls": resolve_image_urls(result.image_sources, result.base_url or url),
+    }))
+
+    # Surface cache hits/misses
+    emit({"type": "capture_cache", "url": url, "status": cache_status})
+    if result.request_stats:
+        emit({"type": "capture_requests", "url": url, **result.request_stats})
+    return result
+
+
+async def generate_clone(
+    trimmed_html_content: str,
+    screenshot: bytes,
+    emit: Callable[[dict], None] = _no_emit,
+    use_cache: bool = True,
+) -> tuple[str, str]:
+    """
+    Have o3 rebuild the page from its screenshot and trimmed HTML. Returns (html, css).
+    With `use_cache` False the response cache is bypassed.
+    """
+    client = get_openai_client()
+
+    if CLONE_SECTIONED:
+        sections = await asyncio.to_thread(plan_sections, trimmed_html_content)
+        if sections:
+            return await _generate_sectioned(client, trimmed_html_content, sections, screenshot, emit, use_cache)
+
+    # Keep the pasted HTML inside the prompt's token budget. This and the image
+    # work below are CPU-bound, so keep them off the event loop.
+    with span("clone.reduce_html") as reduce_span:
+        reduced_html, tokens_before, tokens_after = await asyncio.to_thread(
+            reduce_html_to_token_budget, trimmed_html_content, CLONE_HTML_TOKEN_BUDGET
+        )
+        reduce_span.set(html_tokens=tokens_before, reduced_tokens=tokens_after)
+    print(f"[+] Clone prompt HTML: {tokens_before} -> {tokens_after} tokens (budget {CLONE_HTML_TOKEN_BUDGET})")
+    emit({"type": "html_tokens", "before": tokens_before, "after": tokens_after})
+
+    # Downscale, tile and re-encode the screenshot before uploading it
+    with span("clone.encode_screenshot", image_bytes=len(screenshot)) as encode_span:
+        screenshot_parts = await asyncio.to_thread(
+            prepare_screenshot_for_upload, screenshot
+        )
+        encode_span.set(
+            tiles=len(screenshot_parts),
+            payload_bytes=sum(len(part["image_url"]["url"]) for part in screenshot_parts),
+        )
+
+    messages = [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": f"""
+                ### SYSTEM
+You are "Pixel-Perfect Front-End", a senior web-platform engineer who specialises in
+ * redesigning bloated, auto-generated pages into clean, semantic, WCAG-conformant HTML/CSS
+ * matching the *visual* layout of the reference screenshot to within ±2 px for all major breakpoints
+
+When you reply you MUST:
+1. **Think step-by-step silently** ("internal reasoning"), then **output nothing but the final HTML inside a single fenced code block**.
+2. **Inline zero commentary** - the code block is the entire answer.
+3. Use **only system fonts** (font-stack: `Roboto, Arial, Helvetica, sans-serif`) and a single `<style>` block in the `<head>`.
+4. Avoid JavaScript unless explicitly asked; replicate all interactions with pure HTML/CSS where feasible.
+5. Preserve all outbound links exactly as provided in the RAW_HTML input.
+7. Ensure the layout is mobile-first responsive (Flexbox/Grid) and maintains the same visual hierarchy:  
+   e.g) **header ➔ main (logo, search box, buttons, promo) ➔ footer**.
+
+### USER CONTEXT
+You will receive two payloads:
+
+**SCREENSHOT** - Your primary reference for all visual styling, layout, colors, and fonts.
+**RAW_HTML** - The stripped, uglified DOM dump. Elements may carry `data-box="x,y,width,height"`: where they sit on the page, in CSS pixels.
+
+### TASK
+1. **Your goal is to re-create the page from the SCREENSHOT as a single, clean HTML document.**
+2. **Use the RAW_HTML *only* to extract content like text, links (`href`), and accessibility attributes (`alt`, `aria-label`).**
+3. **Do NOT replicate the original's CSS or inline styles.** Create your own clean CSS in a `<style>` tag to match the screenshot's appearance.
+4. **Discard** every element from the RAW_HTML that is not visible in the screenshot.
+
+### OUTPUT FORMAT
+Return one fenced code block starting with <!DOCTYPE html> and ending with </html>
+No extra markdown, no explanations, no leading or trailing whitespace outside the code block.
+                 
+                 Here is the trimmed down HTML:
+                 {reduced_html}
+            `"""},
+            {"type": "text", "text": f"SCREENSHOT: {len(screenshot_parts)} vertical tile(s) of the full page, in order from top to bottom."},
+            *screenshot_parts,
+        ],
+    }]
+
+    # The same page and screenshot always get the same answer back from the cache
+    key = llm_cache.key("o3", canonical_chat_messages(messages))
+    response, cache_status = await llm_cache.call(
+        "clone",
+        key,
+        lambda: _traced_completion(client.chat.completions.create(model="o3", messages=messages)),
+        dump_chat_completion,
+        load_chat_completion,
+        enabled=use_cache,
+    )
+    emit({"type": "llm_cache", "call": "clone", "status": cache_status})
+
+    # 1. Get the raw HTML content from the LLM response
+    full_html = response.choices[0].message.content
+
+    # 2. Clean it up and split out the CSS
+    with span("clone.postprocess", response_bytes=len(full_html)) as postprocess_span:
+        html_code, css_code = await asyncio.to_thread(_split_clone_response, full_html)
+        postprocess_span.set(html_bytes=len(html_code), css_bytes=len(css_code))
+    return html_code, css_code
+
+
+_SECTION_PROMPT = """
+### SYSTEM
+You are "Pixel-Perfect Front-End", a senior web-platform engineer who rebuilds web pages as clean, semantic, WCAG-conformant HTML/CSS
+matching the *visual* layout of a reference screenshot to within ±2 px.
+
+You are rebuilding ONE horizontal region of a page. Other engineers rebuild the regions above and below it at the same time,
+and the results are stacked in order, each spanning the full page width.
+
+When you reply you MUST:
+1. **Think step-by-step silently**, then **output nothing but the code inside a single fenced code block**.
+2. Start with a single `<style>` block holding the CSS for this region, followed by the region's markup: one or more top-level
+   elements such as `<header>`, `<section>` or `<footer>`. No `<html>`, `<head>` or `<body>`.
+3. Prefix every class name and id you define with `{prefix}`, and only style elements inside this region. {body_rule}
+4. Use **only system fonts** (font-stack: `Roboto, Arial, Helvetica, sans-serif`) and no JavaScript.
+5. Preserve all outbound links exactly as provided in the RAW_HTML input.
+6. Keep the region mobile-first responsive (Flexbox/Grid).
+
+### USER CONTEXT
+**SCREENSHOT** - This region of the page, {top}px to {bottom}px of a {page_height}px tall page. Your primary reference for all
+visual styling, layout, colors, and fonts.
+**RAW_HTML** - This region's elements from the page's DOM, where `data-box="x,y,width,height"` gives each element's position
+on the page in CSS pixels. Use it *only* for content: text, links (`href`) and accessibility attributes (`alt`, `aria-label`).
+Discard every element that is not visible in the screenshot.
+
+Here is the region's HTML:
+{html}
+"""
+
+
+async def _generate_sectioned(
+    client,
+    trimmed_html_content: str,
+    sections: list[Section],
+    screenshot: bytes,
+    emit: Callable[[dict], None],
+    use_cache: bool,
+) -> tuple[str, str]:
+    """
+    Generate each region of the page in its own o3 call, CLONE_SECTION_CONCURRENCY
+    at a time, and stitch the results into one page with one merged stylesheet.
+    """
+    emit({"type": "clone_sections", "count": len(sections), "landmarks": [section.landmarks for section in sections]})
+    gate = asyncio.Semaphore(max(1, CLONE_SECTION_CONCURRENCY))
+
+    async def clone_section(section: Section) -> tuple[str, str]:
+        async with gate:
+            with span("clone.section", index=section.index, top=section.top, bottom=section.bottom) as section_span:
+                reduced_html, tokens_before, tokens_after = await asyncio.to_thread(
+                    reduce_html_to_token_budget, section.html, CLONE_HTML_TOKEN_BUDGET
+                )
+                screenshot_parts = await asyncio.to_thread(
+                    prepare_screenshot_for_upload,
+                    screenshot,
+                    region=(section.top / section.page_height, section.bottom / section.page_height),
+                )
+                prompt = _SECTION_PROMPT.format(
+                    prefix=f"s{section.index + 1}-",
+                    body_rule="You may also set the base styles of `body`." if section.index == 0 else "Never style `html`, `body` or `*`.",
+                    top=section.top,
+                    bottom=section.bottom,
+                    page_height=section.page_height,
+                    html=reduced_html,
+                )
+                messages = [{"role": "user", "content": [{"type": "text", "text": prompt}, *screenshot_parts]}]
+                response, cache_status = await llm_cache.call(
+                    "clone_section",
+                    llm_cache.key("o3", canonical_chat_messages(messages)),
+                    lambda: _traced_completion(client.chat.completions.create(model="o3", messages=messages)),
+                    dump_chat_completion,
+                    load_chat_completion,
+                    enabled=use_cache,
+                )
+                fragment, css_code = await asyncio.to_thread(_split_section_response, response.choices[0].message.content)
+                section_span.set(html_tokens=tokens_before, reduced_tokens=tokens_after, tiles=len(screenshot_parts), cache=cache_status)
+        emit({"type": "clone_section", "index": section.index, "landmarks": section.landmarks, "cache": cache_status})
+        return fragment, css_code
+
+    # Wall-clock time is that of the slowest region; a failed region fails the clone.
+    tasks = [asyncio.ensure_future(clone_section(section)) for section in sections]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    with span("clone.stitch", sections=len(results)) as stitch_span:
+        html_code = await asyncio.to_thread(stitch_sections, page_title(trimmed_html_content), [fragment for fragment, _ in results])
+        css_code = await asyncio.to_thread(merge_css, [css for _, css in results])
+        stitch_span.set(html_bytes=len(html_code), css_bytes=len(css_code))
+    return html_code, css_code
+
+
+async def _traced_completion(request) -> Any:
+    """Await a chat completion request in an LLM slot, timing the call itself and recording its token usage."""
+    async with llm_slots:
+        with span("clone.llm", model="o3") as llm_span:
+            response = await request
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                llm_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    return response
+
+
+async def fetch_images(workspace: Workspace, emit: Callable[[dict], None] = _no_emit) -> tuple[str, dict[str, str]]:
+    """
+    Download the images of the page captured into `workspace`. Returns the
+    page's base URL and image URL -> asset name for the downloaded ones.
+    """
+    manifest = await workspace.read_text(IMAGE_MANIFEST)
+    if manifest is None:
+        return "", {}
+    manifest = json.loads(manifest)
+    with span("clone.images", images=len(manifest["urls"])) as images_span:
+        assets = await image_fetcher.fetch_all(manifest["urls"])
+        images_span.set(fetched=len(assets))
+    emit({"type": "images", "fetched": len(assets), "total": len(manifest["urls"])})
+    return manifest["base_url"], assets
+
+
+async def write_clone(
+    workspace: Workspace,
+    html_code: str,
+    css_code: str,
+    images: tuple[str, dict[str, str]] | None = None,
+    emit: Callable[[dict], None] = _no_emit,
+):
+    """
+    Write page.css and the final HTML (without the inline style tag) to
+    page.html, pointing its images at the local copies from fetch_images().
+    """
+    with span("clone.write") as write_span:
+        if images and images[1]:
+            html_code, rewritten = await asyncio.to_thread(rewrite_image_sources, html_code, *images)
+            print(f"[+] Pointed {rewritten} image(s) at local copies")
+
+        async def write_pages():
+            async with workspace.lock:
+                if css_code:
+                    await workspace.write(PAGE_CSS, css_code)
+
+                await workspace.write(PAGE_HTML, html_code)
+
+        # A cancelled run must not leave a new page.css next to the old page.html.
+        await asyncio.shield(write_pages())
+        write_span.set(html_bytes=len(html_code), css_bytes=len(css_code))
+    for name in ([PAGE_CSS] if css_code else []) + [PAGE_HTML]:
+        emit({"type": "artifact", "name": name})
+
+
+async def discard_partial_clone(workspace: Workspace, written: set[str]) -> list[str]:
+    """
+    Remove what a cancelled run captured into `workspace` but never turned into
+    a clone, given the names it wrote. Returns the names removed.
+    """
+    if SCREENSHOT not in written or PAGE_HTML in written:
+        return []
+    removed = [name for name in (SCREENSHOT, IMAGE_MANIFEST) if name in written]
+    for name in removed:
+        await workspace.delete(name)
+    return removed
+
+
+async def discard_partial_clones(written: dict[str, set[str]]) -> list[str]:
+    """discard_partial_clone() for every workspace in a record_writes() mapping."""
+    removed = []
+    for thread_id, names in written.items():
+        removed += [f"{thread_id}/{name}" for name in await discard_partial_clone(workspaces.get(thread_id), names)]
+    return removed
+
+
+def _strip_fences(response: str) -> str:
+    # Clean the response, removing markdown fences and extra whitespace
+    cleaned_html = response.strip()
+    if cleaned_html.startswith("```html"):
+        cleaned_html = cleaned_html[7:]
+    elif cleaned_html.startswith("```"):
+        cleaned_html = cleaned_html[3:]
+
+    if cleaned_html.endswith("```"):
+        cleaned_html = cleaned_html[:-3]
+
+    return cleaned_html.strip()
+
+
+def _split_section_response(response: str) -> tuple[str, str]:
+    """Turn the model's fenced region into its markup and its CSS."""
+    soup = BeautifulSoup(_strip_fences(response), 'html.parser')
+    css_code = "\n".join(style_tag.get_text() for style_tag in soup.find_all('style'))
+    for tag in soup.find_all(['style', 'head', 'link', 'meta', 'title']):
+        tag.decompose()
+    # Keep only the body's content if the model sent a whole document anyway
+    root = soup.body or soup.html or soup
+    return root.decode_contents().strip(), css_code.strip()
+
+
+def _split_clone_response(full_html: str) -> tuple[str, str]:
+    """Turn the model's fenced HTML into a page.html body and its extracted page.css."""
+    cleaned_html = _strip_fences(full_html)
+
+    # Parse the CLEANED HTML
+    soup = BeautifulSoup(cleaned_html, 'html.parser')
+
+    # Extract the CSS destined for page.css
+    css_code = ""
+    style_tag = soup.find('style')
+    if style_tag:
+        css_code = style_tag.string or ''
+        style_tag.decompose()
+
+    if css_code:
+        # Add a link to the external stylesheet in the HTML
+        if soup.head:
+            link_tag = soup.new_tag("link", rel="stylesheet", href="page.css")
+            soup.head.append(link_tag)
+
+    return str(soup), css_code.strip()
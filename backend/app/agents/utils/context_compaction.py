@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, SystemMessage, ToolMessage
+
+from app.agents.utils.get_numbered_code_from_file import number_lines
+from app.agents.utils.llm_clients import get_chat_model
+from app.agents.utils.scheduler import llm_slots
+from app.agents.utils.token_budget import count_tokens
+
+# Prompt size above which the oldest turns are folded into a running summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "24000"))
+# Most recent user turns that are never summarized
+KEEP_RECENT_TURNS = int(os.getenv("KEEP_RECENT_TURNS", "2"))
+# Tool arguments and results longer than this are replaced once the model has acted on them
+STALE_CONTENT_CHARS = int(os.getenv("STALE_CONTENT_CHARS", "2000"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4.1-mini")
+
+# Name of the messages carrying file contents, as opposed to real user input
+CONTEXT_PROVIDER = "context_provider"
+
+
+def file_context_messages(messages: list[AnyMessage], files: dict[str, str]) -> list[HumanMessage]:
+    """
+    One numbered context message for each file in `files` (name -> content)
+    whose content the model has not already seen, judged by the hash recorded
+    on the latest context message for that file still in the history.
+    """
+    seen = {}
+    for message in messages:
+        if message.name == CONTEXT_PROVIDER and "file" in message.additional_kwargs:
+            seen[message.additional_kwargs["file"]] = message.additional_kwargs["sha256"]
+
+    new_messages = []
+    for name, content in files.items():
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if seen.get(name) == digest:
+            continue
+        language = "css" if name.endswith(".css") else "html"
+        new_messages.append(HumanMessage(
+            content=f"""Here is the current state of {name}. Each line is prefixed with its line number (`00001: `); the prefix is not part of the file.
+
+### {name}
+```{language}
+{number_lines(content)}
+```
+
+Please use this context to inform your edits. Use `patch_file` with these line numbers for targeted changes; the write tools overwrite the entire file and must not include the line number prefixes.
+""",
+            name=CONTEXT_PROVIDER,
+            additional_kwargs={"file": name, "sha256": digest},
+        ))
+    return new_messages
+
+
+def compact_messages(messages: list[AnyMessage]) -> list[AnyMessage]:
+    """
+    The prompt view of `messages`: file contexts superseded by a newer version
+    of the same file, tool call arguments that have already been executed and
+    tool results the model has already responded to are replaced with short
+    references. The stored history is left untouched.
+    """
+    latest_context = {}
+    last_ai_index = -1
+    for index, message in enumerate(messages):
+        if message.name == CONTEXT_PROVIDER and "file" in message.additional_kwargs:
+            latest_context[message.additional_kwargs["file"]] = index
+        if isinstance(message, AIMessage):
+            last_ai_index = index
+
+    compacted = []
+    for index, message in enumerate(messages):
+        file_name = message.additional_kwargs.get("file") if message.name == CONTEXT_PROVIDER else None
+        if file_name and latest_context[file_name] != index:
+            message = message.model_copy(update={
+                "content": f"[Earlier version of {file_name} omitted; the current version is shown later in the conversation.]"
+            })
+        elif isinstance(message, AIMessage) and message.tool_calls:
+            # By the time the model is called again, every tool call it made has run.
+            message = message.model_copy(update={
+                "tool_calls": [_compact_tool_call(call) for call in message.tool_calls],
+            })
+        elif isinstance(message, ToolMessage) and index < last_ai_index and len(str(message.content)) > STALE_CONTENT_CHARS:
+            message = message.model_copy(update={
+                "content": f"[{len(str(message.content))} characters of `{message.name}` output omitted; already used.]"
+            })
+        compacted.append(message)
+    return compacted
+
+
+def _compact_tool_call(call: dict) -> dict:
+    args = {}
+    for key, value in call["args"].items():
+        if isinstance(value, str) and len(value) > STALE_CONTENT_CHARS:
+            value = f"[{len(value)} characters omitted; see the latest file contents instead.]"
+        args[key] = value
+    return {**call, "args": args}
+
+
+def count_message_tokens(messages: list[AnyMessage], model: str = "o3") -> int:
+    """Approximate prompt tokens for `messages`, including tool call arguments."""
+    total = 0
+    for message in messages:
+        # Every message carries a few tokens of role/formatting overhead.
+        total += 4 + count_tokens(message.text(), model)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            total += count_tokens(json.dumps([call["args"] for call in message.tool_calls]), model)
+    return total
+
+
+def split_for_summary(messages: list[AnyMessage], keep_turns: int = KEEP_RECENT_TURNS) -> tuple[list[AnyMessage], list[AnyMessage]]:
+    """
+    Split the history before the `keep_turns`-th most recent user message, so a
+    tool call is never separated from its result. Returns (older, recent).
+    """
+    turn_starts = [
+        index for index, message in enumerate(messages)
+        if isinstance(message, HumanMessage) and message.name != CONTEXT_PROVIDER
+    ]
+    keep_turns = max(keep_turns, 1)
+    if len(turn_starts) <= keep_turns:
+        return [], messages
+    cut = turn_starts[-keep_turns]
+    return messages[:cut], messages[cut:]
+
+
+async def summarize_messages(messages: list[AnyMessage], previous_summary: str = "") -> str:
+    """Fold `messages` (already compacted) into the running conversation summary."""
+    transcript = []
+    for message in messages:
+        if message.name == CONTEXT_PROVIDER:
+            # File contents are re-sent whenever the model needs them.
+            continue
+        text = message.text()
+        if isinstance(message, AIMessage) and message.tool_calls:
+            text += " " + ", ".join(f"called {call['name']}" for call in message.tool_calls)
+        transcript.append(f"{message.type}: {text[:STALE_CONTENT_CHARS]}")
+
+    prompt = (
+        "Summarize this conversation between a user and a website-building assistant for the assistant's own later use. "
+        "Keep the user's requests and preferences, what was built or changed and anything still unresolved. "
+        "Be concise and factual.\n\n"
+    )
+    if previous_summary:
+        prompt += f"Summary of the conversation before this part:\n{previous_summary}\n\n"
+    prompt += "Conversation:\n" + "\n".join(transcript)
+
+    # "nostream" keeps the summary out of the token stream sent to the client.
+    async with llm_slots:
+        response = await get_chat_model(SUMMARY_MODEL).with_config(tags=["nostream"]).ainvoke([HumanMessage(content=prompt)])
+    return response.text()
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
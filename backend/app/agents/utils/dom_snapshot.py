@@ -0,0 +1,117 @@
+import os
+from html import escape
+
+# Snapshot the rendered page in the browser instead of trimming page.content() in Python
+CAPTURE_SNAPSHOT = os.getenv("CAPTURE_SNAPSHOT", "1") == "1"
+# Elements and text runs kept per snapshot; the rest of the page is cut off
+CAPTURE_SNAPSHOT_MAX_NODES = int(os.getenv("CAPTURE_SNAPSHOT_MAX_NODES", "6000"))
+
+# One pass over the live DOM, returning the visible elements in document order
+# as a flat list:
+#   element  {"t": tag, "d": depth, "b": [x, y, width, height], "a": {attributes}}
+#   text     {"d": depth, "x": text}
+# Boxes are in page coordinates (CSS px). Elements hidden with display:none,
+# visibility:hidden or opacity:0 are dropped with their subtree; zero-size
+# elements are dropped but their children kept, since floated or positioned
+# children can still show. Image URLs come from currentSrc (the srcset
+# candidate the browser picked) and computed background-image, resolved.
+DOM_SNAPSHOT_SCRIPT = """(maxNodes) => {
+    const SKIP = new Set(["head", "script", "style", "noscript", "template", "meta", "link",
+                          "iframe", "svg", "canvas", "video", "audio", "object", "embed"]);
+    const VOID = new Set(["img", "input", "br", "hr", "wbr", "area"]);
+    const ATTRS = ["href", "alt", "title", "aria-label", "placeholder", "type", "role", "name"];
+    const URL_PATTERN = /url\\(["']?(.*?)["']?\\)/g;
+    const scrollX = window.scrollX, scrollY = window.scrollY;
+    const nodes = [];
+    const images = new Set();
+    let truncated = false;
+
+    const walk = (element, depth) => {
+        for (const child of element.childNodes) {
+            if (nodes.length >= maxNodes) { truncated = true; return; }
+            if (child.nodeType === Node.TEXT_NODE) {
+                const text = child.data.replace(/\\s+/g, " ");
+                if (text.trim()) nodes.push({d: depth, x: text});
+                continue;
+            }
+            if (child.nodeType !== Node.ELEMENT_NODE) continue;
+            const tag = child.localName;
+            if (SKIP.has(tag)) continue;
+            const style = getComputedStyle(child);
+            if (style.display === "none" || style.visibility === "hidden" || style.opacity === "0") continue;
+
+            const rect = child.getBoundingClientRect();
+            if (rect.width === 0 || rect.height === 0 || style.display === "contents") {
+                walk(child, depth);
+                continue;
+            }
+            const attributes = {};
+            for (const name of ATTRS) {
+                const value = child.getAttribute(name);
+                if (value !== null && value !== "") attributes[name] = value;
+            }
+            if (tag === "img") {
+                const src = child.currentSrc || child.src;
+                if (src) { attributes.src = src; images.add(src); }
+            } else if (tag === "input" && child.value && child.type !== "password") {
+                attributes.value = child.value;
+            }
+            if (style.backgroundImage !== "none") {
+                const backgrounds = [...style.backgroundImage.matchAll(URL_PATTERN)].map(match => match[1]);
+                if (backgrounds.length) {
+                    attributes["data-bg"] = backgrounds.join(" ");
+                    backgrounds.forEach(url => images.add(url));
+                }
+            }
+            nodes.push({
+                t: tag,
+                d: depth,
+                b: [Math.round(rect.left + scrollX), Math.round(rect.top + scrollY), Math.round(rect.width), Math.round(rect.height)],
+                a: attributes,
+            });
+            if (!VOID.has(tag)) walk(child, depth + 1);
+        }
+    };
+    if (document.body) walk(document.body, 0);
+
+    return {
+        base_url: document.baseURI,
+        title: document.title,
+        width: document.documentElement.scrollWidth,
+        height: document.documentElement.scrollHeight,
+        nodes,
+        images: [...images],
+        truncated,
+    };
+}"""
+
+_VOID_TAGS = frozenset({"img", "input", "br", "hr", "wbr", "area"})
+
+
+def render_snapshot(snapshot: dict) -> str:
+    """
+    Turn a DOM_SNAPSHOT_SCRIPT result into the compact HTML the clone prompt
+    takes, each element carrying its box as data-box="x,y,width,height".
+    """
+    out = [
+        f"<html><head><title>{escape(snapshot['title'], quote=False)}</title></head>"
+        f'<body data-box="0,0,{snapshot["width"]},{snapshot["height"]}">'
+    ]
+    # Tags still open, innermost last; depth n sits inside the first n of them
+    open_tags: list[str] = []
+    for node in snapshot["nodes"]:
+        while len(open_tags) > node["d"]:
+            out.append(f"</{open_tags.pop()}>")
+        if "x" in node:
+            out.append(escape(node["x"], quote=False))
+            continue
+        attributes = "".join(f' {name}="{escape(value)}"' for name, value in node["a"].items())
+        out.append(f'<{node["t"]} data-box="{",".join(map(str, node["b"]))}"{attributes}>')
+        if node["t"] not in _VOID_TAGS:
+            open_tags.append(node["t"])
+    while open_tags:
+        out.append(f"</{open_tags.pop()}>")
+    if snapshot.get("truncated"):
+        out.append("<!-- remainder of the page omitted from the snapshot -->")
+    out.append("</body></html>")
+    return "".join(out)
@@ -1,6 +1,90 @@
+import os
+import time
+import io
 import base64
 
-# Function to encode the image
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8") 
\ No newline at end of file
+from PIL import Image
+
+# Screenshot preprocessing before upload to the vision model. The model scales
+# images down to fit 2048px and then to 768px on the short side, so anything
+# larger only costs upload bandwidth.
+SCREENSHOT_MAX_WIDTH = int(os.getenv("SCREENSHOT_MAX_WIDTH", "1024"))
+SCREENSHOT_TILE_HEIGHT = int(os.getenv("SCREENSHOT_TILE_HEIGHT", "1536"))
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "jpeg").lower()
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+_FORMAT_ALIASES = {"jpg": "jpeg"}
+
+
+def _image_format(name: str) -> str:
+    image_format = _FORMAT_ALIASES.get(name.lower(), name.lower())
+    if image_format not in _MIME_TYPES:
+        raise ValueError(f"Screenshot format must be one of {', '.join(_MIME_TYPES)}, not {name!r}")
+    return image_format
+
+
+SCREENSHOT_FORMAT = _image_format(SCREENSHOT_FORMAT)
+
+
+def _tile_bounds(height: int, tile_height: int) -> list[tuple[int, int]]:
+    bounds = [(top, min(top + tile_height, height)) for top in range(0, height, tile_height)]
+    # Fold a thin last sliver into the tile above instead of sending it alone.
+    if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < tile_height // 4:
+        bounds[-2:] = [(bounds[-2][0], height)]
+    return bounds
+
+
+def prepare_screenshot_for_upload(
+    image: str | bytes,
+    max_width: int = SCREENSHOT_MAX_WIDTH,
+    tile_height: int = SCREENSHOT_TILE_HEIGHT,
+    image_format: str = SCREENSHOT_FORMAT,
+    quality: int = SCREENSHOT_QUALITY,
+    region: tuple[float, float] | None = None,
+) -> list[dict]:
+    """
+    Turn a full-page screenshot into chat completion `image_url` parts: scaled
+    down to `max_width`, split top to bottom into tiles of at most `tile_height`
+    pixels and re-encoded as JPEG or WebP. `image` is a file path or the raw
+    image bytes. `region` keeps only a horizontal band, given as the fractions
+    of the screenshot's height where it starts and ends.
+    """
+    start = time.perf_counter()
+    image_format = _image_format(image_format)
+    mime_type = _MIME_TYPES[image_format]
+
+    parts = []
+    payload_bytes = 0
+    if isinstance(image, bytes):
+        source, source_bytes = io.BytesIO(image), len(image)
+    else:
+        source, source_bytes = image, os.path.getsize(image)
+
+    with Image.open(source) as screenshot:
+        image = screenshot.convert("RGB")
+        if region is not None:
+            top, bottom = (round(fraction * image.height) for fraction in region)
+            image = image.crop((0, max(top, 0), image.width, min(max(bottom, top + 1), image.height)))
+        if image.width > max_width:
+            scaled_height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, scaled_height), Image.LANCZOS)
+
+        for top, bottom in (_tile_bounds(image.height, tile_height)):
+            tile = io.BytesIO()
+            image.crop((0, top, image.width, bottom)).save(
+                tile, format=image_format.upper(), quality=quality, optimize=True
+            )
+            base64_tile = base64.b64encode(tile.getbuffer()).decode("ascii")
+            payload_bytes += len(base64_tile)
+            parts.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:{mime_type};base64,{base64_tile}"},
+            })
+
+    print(
+        f"[+] Screenshot payload: {len(parts)} {image_format} tile(s), "
+        f"{payload_bytes / 1024:.0f} KB base64 (source {source_bytes / 1024:.0f} KB), "
+        f"encoded in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    return parts
@@ -0,0 +1,112 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+# Records the time of the last DOM change that could mean lazy content arrived.
+_INSTALL_MUTATION_WATCH = """
+() => {
+    if (window.__lazyScrollWatch) return;
+    const watch = { lastMutation: performance.now() };
+    new MutationObserver(() => { watch.lastMutation = performance.now(); }).observe(
+        document.documentElement,
+        { childList: true, subtree: true, attributes: true, attributeFilter: ["src", "srcset"] }
+    );
+    window.__lazyScrollWatch = watch;
+}
+"""
+
+_MS_SINCE_LAST_MUTATION = "() => performance.now() - window.__lazyScrollWatch.lastMutation"
+
+_SCROLL_POSITION = """
+() => [
+    window.scrollY + window.innerHeight,
+    Math.max(document.body.scrollHeight, document.documentElement.scrollHeight),
+]
+"""
+
+
+@dataclass
+class ScrollPolicy:
+    """Limits for scrolling a page to trigger its lazy-loaded content."""
+
+    # Hard cap on the whole scroll phase.
+    max_seconds: float = field(default_factory=lambda: float(os.getenv("SCROLL_MAX_SECONDS", "15")))
+    # Stop once the document is this tall, e.g. on infinite-scroll feeds.
+    max_height: int = field(default_factory=lambda: int(os.getenv("SCROLL_MAX_HEIGHT", "20000")))
+    # A step is settled once the DOM has been quiet this long...
+    settle_ms: int = field(default_factory=lambda: int(os.getenv("SCROLL_SETTLE_MS", "400")))
+    # ...and no more than this many requests are still in flight.
+    max_inflight_requests: int = 2
+    # Give up waiting for a single step to settle after this long.
+    step_timeout_ms: int = field(default_factory=lambda: int(os.getenv("SCROLL_STEP_TIMEOUT_MS", "3000")))
+    poll_ms: int = 100
+
+
+@dataclass
+class ScrollStats:
+    steps: int
+    elapsed_ms: int
+    final_height: int
+    # One of "settled", "time_limit" or "height_limit".
+    stop_reason: str
+
+
+async def scroll_until_settled(page, policy: ScrollPolicy | None = None) -> ScrollStats:
+    """
+    Scroll one viewport at a time, waiting after each step until the DOM stops
+    changing and the network goes idle. Stops at the bottom of the page once
+    nothing new loads, or when the time or height cap is hit.
+    """
+    policy = policy or ScrollPolicy()
+    start = time.monotonic()
+    deadline = start + policy.max_seconds
+
+    inflight = set()
+    on_request = inflight.add
+    on_request_done = inflight.discard
+    page.on("request", on_request)
+    page.on("requestfinished", on_request_done)
+    page.on("requestfailed", on_request_done)
+
+    steps = 0
+    try:
+        await page.evaluate(_INSTALL_MUTATION_WATCH)
+        while True:
+            position, height = await page.evaluate(_SCROLL_POSITION)
+            if height >= policy.max_height:
+                stop_reason = "height_limit"
+                break
+            # Sub-pixel scroll offsets can leave us a fraction short of the end.
+            if position >= height - 1:
+                stop_reason = "settled"
+                break
+            if time.monotonic() >= deadline:
+                stop_reason = "time_limit"
+                break
+
+            await page.evaluate("() => window.scrollBy(0, window.innerHeight)")
+            steps += 1
+            await _wait_until_settled(page, inflight, policy, deadline)
+
+        # Screenshots should start from the top, with sticky headers in place.
+        await page.evaluate("() => window.scrollTo(0, 0)")
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("requestfinished", on_request_done)
+        page.remove_listener("requestfailed", on_request_done)
+
+    return ScrollStats(
+        steps=steps,
+        elapsed_ms=int((time.monotonic() - start) * 1000),
+        final_height=height,
+        stop_reason=stop_reason,
+    )
+
+
+async def _wait_until_settled(page, inflight: set, policy: ScrollPolicy, deadline: float):
+    step_deadline = min(deadline, time.monotonic() + policy.step_timeout_ms / 1000)
+    while time.monotonic() < step_deadline:
+        quiet_ms = await page.evaluate(_MS_SINCE_LAST_MUTATION)
+        if quiet_ms >= policy.settle_ms and len(inflight) <= policy.max_inflight_requests:
+            return
+        await page.wait_for_timeout(policy.poll_ms)
@@ -0,0 +1,215 @@
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+from typing import Any, Awaitable, Callable, TypeVar
+
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from openai.types.chat import ChatCompletion
+
+from app.agents.utils.metrics import Counter
+
+T = TypeVar("T")
+
+# "readwrite" serves repeated prompts from disk and stores new responses,
+# "record" always calls the model but stores what it returns, "replay" never
+# calls the model and fails on a miss (offline tests against recorded
+# responses), and "off" bypasses the cache.
+LLM_CACHE_MODES = ("readwrite", "record", "replay", "off")
+
+llm_cache_requests = Counter(
+    "llm_cache_requests_total", "LLM calls by how the response cache served them", ("call", "status")
+)
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode for a prompt that has no recorded response."""
+
+
+def _hash_data_url(url: str) -> str:
+    if url.startswith("data:"):
+        # The screenshot is hashed rather than pasted into the key.
+        return "sha256:" + hashlib.sha256(url.encode("ascii", "ignore")).hexdigest()
+    return url
+
+
+def _canonical_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            image = part["image_url"]
+            image = {**image, "url": _hash_data_url(image["url"])} if isinstance(image, dict) else _hash_data_url(image)
+            part = {**part, "image_url": image}
+        parts.append(part)
+    return parts
+
+
+def canonical_chat_messages(messages: list[dict]) -> list[dict]:
+    """OpenAI chat messages with their image payloads replaced by hashes."""
+    return [{**message, "content": _canonical_content(message.get("content", ""))} for message in messages]
+
+
+def canonical_langchain_messages(messages: list[BaseMessage]) -> list[dict]:
+    """
+    LangChain messages reduced to what the model sees. Message ids and
+    response metadata differ between otherwise identical turns, so they
+    are left out.
+    """
+    canonical = []
+    for message in messages:
+        entry = {"type": message.type, "content": _canonical_content(message.content)}
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            entry["tool_calls"] = [{"id": call["id"], "name": call["name"], "args": call["args"]} for call in tool_calls]
+        tool_call_id = getattr(message, "tool_call_id", None)
+        if tool_call_id:
+            entry["tool_call_id"] = tool_call_id
+        canonical.append(entry)
+    return canonical
+
+
+def dump_ai_message(message: BaseMessage) -> dict:
+    return messages_to_dict([message])[0]
+
+
+def load_ai_message(data: dict) -> BaseMessage:
+    return messages_from_dict([data])[0]
+
+
+def dump_chat_completion(completion: ChatCompletion) -> dict:
+    return completion.model_dump(mode="json")
+
+
+def load_chat_completion(data: dict) -> ChatCompletion:
+    return ChatCompletion.model_validate(data)
+
+
+class LLMCache:
+    """
+    On-disk cache of LLM responses, one file per prompt:
+
+        <directory>/<sha256 of the model, canonical messages and tools>.json
+
+    Responses are stored whole, tool calls and usage included, so a hit is
+    indistinguishable from the original call. The directory is kept under
+    `max_bytes` by evicting the least recently used entries, tracked through
+    their mtime. Files are read and written in worker threads, and the
+    directory is only scanned once it may be over budget.
+    """
+
+    def __init__(self, directory: str | None = None, max_bytes: int | None = None, mode: str | None = None):
+        self.directory = directory or os.getenv("LLM_CACHE_DIR", ".cache/llm")
+        self.max_bytes = max_bytes or int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.mode = mode or os.getenv("LLM_CACHE_MODE", "readwrite")
+        if self.mode not in LLM_CACHE_MODES:
+            raise ValueError(f"LLM_CACHE_MODE must be one of {', '.join(LLM_CACHE_MODES)}, not {self.mode!r}")
+        # Size of the directory as of the last scan plus what has been written
+        # since; None until the first put scans it.
+        self._bytes: int | None = None
+
+    def key(self, model: str, messages: list, **options) -> str:
+        payload = json.dumps({"model": model, "messages": messages, **options}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    async def get(self, key: str) -> dict | None:
+        return await asyncio.to_thread(self._read, key)
+
+    async def put(self, key: str, call: str, response: dict):
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in await asyncio.to_thread(self._entries))
+        self._bytes += await asyncio.to_thread(self._write, key, {"call": call, "response": response})
+        if self._bytes > self.max_bytes:
+            self._bytes = await asyncio.to_thread(self._evict)
+
+    def _read(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+            # Mark the entry as recently used for LRU eviction.
+            os.utime(self._path(key))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry["response"]
+
+    def _write(self, key: str, entry: dict) -> int:
+        """Store `entry` under `key`. Returns how much the directory grew, in bytes."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        added = os.path.getsize(tmp_path)
+        try:
+            replaced = os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, self._path(key))
+        return added - replaced
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) of every entry."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> int:
+        """Remove least recently used entries until the directory fits. Returns its new size."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    async def call(
+        self,
+        call: str,
+        key: str,
+        request: Callable[[], Awaitable[T]],
+        dump: Callable[[T], dict],
+        load: Callable[[dict], T],
+        enabled: bool = True,
+    ) -> tuple[T, str]:
+        """
+        Serve `key` from the cache or await `request()` and store its response.
+        `call` names the call site in metrics and entries. Returns the response
+        and "hit", "miss" or "bypass".
+        """
+        if self.mode == "off" or not enabled:
+            llm_cache_requests.inc(call=call, status="bypass")
+            return await request(), "bypass"
+
+        if self.mode in ("readwrite", "replay"):
+            cached = await self.get(key)
+            if cached is not None:
+                llm_cache_requests.inc(call=call, status="hit")
+                return load(cached), "hit"
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded {call} response for key {key[:12]} in {self.directory}")
+
+        response = await request()
+        await self.put(key, call, dump(response))
+        llm_cache_requests.inc(call=call, status="miss")
+        return response, "miss"
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,44 @@
+import os
+import functools
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The process-wide keep-alive connection pool shared by every OpenAI client,
+    so turns reuse warm TLS connections instead of handshaking each time.
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "120")),
+    )
+    # o3 with a large screenshot can take minutes; only connecting should be quick.
+    timeout = httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_SECONDS", "600")), connect=10.0)
+    return DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(http_client=get_http_client())
+
+
+@functools.lru_cache(maxsize=None)
+def get_chat_model(model: str) -> ChatOpenAI:
+    return ChatOpenAI(model=model, http_async_client=get_http_client())
+
+
+async def close_llm_clients():
+    """Close the shared connection pool; clients are rebuilt on next use."""
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+    get_chat_model.cache_clear()
+    get_openai_client.cache_clear()
+    get_http_client.cache_clear()
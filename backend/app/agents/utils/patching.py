@@ -0,0 +1,127 @@
+import re
+
+from pydantic import BaseModel, Field
+
+from app.agents.utils.get_numbered_code_from_file import split_lines
+
+# How far a unified-diff hunk may have drifted from its stated line number
+MAX_HUNK_OFFSET = 200
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """A patch that does not apply cleanly to the current file; nothing was changed."""
+
+
+class LineEdit(BaseModel):
+    start_line: int = Field(description="First line to replace, 1-based, as numbered in the context.")
+    end_line: int = Field(description="Last line to replace, inclusive. Use start_line - 1 to insert before start_line without replacing anything.")
+    replacement: str = Field(description="New text for the range; an empty string deletes the lines.")
+    expected: str | None = Field(default=None, description="The current text of the range, checked before applying.")
+
+
+def apply_line_edits(code: str, edits: list[LineEdit]) -> str:
+    """
+    Replace 1-based inclusive line ranges of `code`. Every edit refers to the
+    original numbering, edits may not overlap, and either all of them apply or
+    a PatchError is raised.
+    """
+    lines = split_lines(code)
+    ordered = sorted(edits, key=lambda edit: (edit.start_line, edit.end_line))
+
+    previous_end = 0
+    for edit in ordered:
+        if edit.start_line < 1 or edit.end_line < edit.start_line - 1 or edit.end_line > len(lines):
+            raise PatchError(f"Lines {edit.start_line}-{edit.end_line} are outside the file (1-{len(lines)})")
+        if edit.start_line <= previous_end:
+            raise PatchError(f"Edit at line {edit.start_line} overlaps the edit ending at line {previous_end}")
+        if edit.expected is not None:
+            current = lines[edit.start_line - 1:edit.end_line]
+            if not _same_lines(current, split_lines(edit.expected)):
+                raise PatchError(
+                    f"Lines {edit.start_line}-{edit.end_line} do not match `expected`; they currently read:\n"
+                    + "\n".join(current)
+                )
+        previous_end = edit.end_line
+
+    # Apply bottom-up so earlier line numbers stay valid.
+    for edit in reversed(ordered):
+        lines[edit.start_line - 1:edit.end_line] = split_lines(edit.replacement)
+    return _join_lines(lines, code)
+
+
+def apply_unified_diff(code: str, diff: str) -> str:
+    """
+    Apply the hunks of a unified diff to `code`. Each hunk's context and removed
+    lines must match the file (ignoring trailing whitespace) at its stated
+    position or, if the line numbers are off, at the nearest position within
+    MAX_HUNK_OFFSET lines. Either all hunks apply or a PatchError is raised.
+    """
+    lines = split_lines(code)
+    hunks = _parse_hunks(diff)
+    if not hunks:
+        raise PatchError("The diff contains no @@ hunks")
+
+    replacements = []
+    search_from = 0
+    for old_start, old_lines, new_lines in hunks:
+        position = _locate(lines, old_lines, max(old_start - 1, 0), search_from)
+        if position is None:
+            raise PatchError(
+                f"Hunk starting at line {old_start} does not match the file; expected:\n" + "\n".join(old_lines)
+            )
+        replacements.append((position, position + len(old_lines), new_lines))
+        search_from = position + len(old_lines)
+
+    for start, end, new_lines in reversed(replacements):
+        lines[start:end] = new_lines
+    return _join_lines(lines, code)
+
+
+def _parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    hunks = []
+    current = None
+    for line in diff.rstrip("\n").split("\n"):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            old_start = int(header.group(1))
+            # "-5,0" means "insert after line 5", i.e. before line 6.
+            if header.group(2) == "0":
+                old_start += 1
+            current = (old_start, [], [])
+            hunks.append(current)
+        elif current is None or line.startswith("\\"):
+            # File headers and "\ No newline at end of file"
+            continue
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+        elif line.startswith("+"):
+            current[2].append(line[1:])
+        else:
+            # Context; models often drop the leading space on blank lines.
+            text = line[1:] if line.startswith(" ") else line
+            current[1].append(text)
+            current[2].append(text)
+    return hunks
+
+
+def _locate(lines: list[str], block: list[str], expected: int, search_from: int) -> int | None:
+    """The start of `block` in `lines` closest to `expected`, at or after `search_from`."""
+    for offset in range(MAX_HUNK_OFFSET + 1):
+        for start in (expected - offset, expected + offset) if offset else (expected,):
+            if start >= search_from and start + len(block) <= len(lines):
+                if _same_lines(lines[start:start + len(block)], block):
+                    return start
+    return None
+
+
+def _same_lines(a: list[str], b: list[str]) -> bool:
+    return len(a) == len(b) and all(x.rstrip() == y.rstrip() for x, y in zip(a, b))
+
+
+def _join_lines(lines: list[str], original: str) -> str:
+    text = "\n".join(lines)
+    if lines and original.endswith("\n"):
+        text += "\n"
+    return text
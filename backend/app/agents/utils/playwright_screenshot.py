@@ -1,88 +1,129 @@
 import os
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import re
-from dotenv import load_dotenv, find_dotenv
+from dataclasses import dataclass, field
 
-load_dotenv(find_dotenv())
+from app.agents.utils.browser_pool import browser_pool
+from app.agents.utils.dom_snapshot import CAPTURE_SNAPSHOT, CAPTURE_SNAPSHOT_MAX_NODES, DOM_SNAPSHOT_SCRIPT, render_snapshot
+from app.agents.utils.lazy_scroll import ScrollPolicy, ScrollStats, scroll_until_settled
+from app.agents.utils.request_blocking import request_blocker
+from app.agents.utils.tracing import bind_trace, span
+from app.agents.utils.trim_html import trim_html_for_llm
+
+
+# Playwright's default, made explicit because it is part of the capture cache key.
+DEFAULT_VIEWPORT = {"width": 1280, "height": 720}
 
-async def _get_browser(p):
-    """
-    Connect to Browserless when credentials are available;
-    otherwise launch a local headless browser.
-    """
-    token = os.getenv("BROWSERLESS_API_TOKEN")
-    ws_endpoint = os.getenv("BROWSERLESS_WS_ENDPOINT")
-
-    if not ws_endpoint and token:
-        ws_endpoint = f"wss://chrome.browserless.io?token={token}"
-
-    if ws_endpoint:
-        print(f"[+] Connecting to Browserless...")
-        return await p.chromium.connect_over_cdp(ws_endpoint)
-
-    print("[!] No Browserless credentials found - launching local headless Chromium.")
-    print("[!] To use Browserless, set BROWSERLESS_API_TOKEN in a .env file.")
-    return await p.chromium.launch(headless=True)
-
-
-async def capture_page_and_img_src(url: str, image_path: str) -> tuple[str, list[str]]:
-    async with async_playwright() as p:
-        browser = await _get_browser(p)
-        page = await browser.new_page()
-
-        try:
-            await page.goto(url, wait_until="domcontentloaded")
-
-            # Scroll down the page to trigger lazy-loaded content
-            last_height = await page.evaluate("document.body.scrollHeight")
-            while True:
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                # Wait for new content to load
-                await page.wait_for_timeout(2000)
-                new_height = await page.evaluate("document.body.scrollHeight")
-                if new_height == last_height:
-                    break
-                last_height = new_height
-
-            # Ensure the directory exists before saving the screenshot
-            os.makedirs(os.path.dirname(image_path), exist_ok=True)
-            await page.screenshot(path=image_path, full_page=True)
-            print(f"[+] Screenshot saved to {image_path}")
 
-            html = await page.content()
-            img_elements = await page.query_selector_all("img")
-            image_sources_with_none = await asyncio.gather(
-                *[img.get_attribute("src") for img in img_elements]
-            )
-            image_sources = [src for src in image_sources_with_none if src is not None]
+@dataclass
+class CaptureResult:
+    trimmed_html: str
+    image_sources: list[str]
+    # ETag / Last-Modified from the main document, for cache revalidation.
+    validators: dict[str, str] = field(default_factory=dict)
+    scroll_stats: ScrollStats | None = None
+    # What relative image_sources resolve against (after redirects and <base href>)
+    base_url: str = ""
+    # Requests the page made and what the capture profile blocked (fresh captures only)
+    request_stats: dict | None = None
 
-            trimmed_html = trim_html_for_llm(html)
 
-            return trimmed_html, image_sources
-        finally:
-            await browser.close()
+_IMAGE_SOURCES_SCRIPT = """() => ({
+    base_url: document.baseURI,
+    sources: Array.from(document.images, img => img.getAttribute("src")).filter(src => src !== null),
+})"""
 
 
-def trim_html_for_llm(html: str) -> str:
-    soup = BeautifulSoup(html, 'html.parser')
+async def capture_page_and_img_src(
+    url: str, image_path: str, scroll_policy: ScrollPolicy | None = None
+) -> tuple[str, list[str]]:
+    result = await capture_page(url, image_path, scroll_policy)
+    return result.trimmed_html, result.image_sources
 
-    for tag_name in ['script', 'meta', 'noscript', 'iframe', 'svg', 'canvas', 'video', 'audio', 'link', 'style']:
-        for tag in soup.find_all(tag_name):
-            tag.decompose()
 
-    # Only allow a minimal set of attributes
-    allowed_attrs = {"src", "href", "alt", "title"}
+async def capture_page(
+    url: str, image_path: str, scroll_policy: ScrollPolicy | None = None
+) -> CaptureResult:
+    # Playwright objects belong to the pool's loop, so the whole capture runs there.
+    page_data, result = await browser_pool.run(bind_trace(_capture_page(url, image_path, scroll_policy)))
 
-    for tag in soup.find_all(True):
-        original_attributes = list(tag.attrs.keys())
+    if isinstance(page_data, dict):
+        with span("capture.render_snapshot", nodes=len(page_data["nodes"])) as render_span:
+            result.trimmed_html = await asyncio.to_thread(render_snapshot, page_data)
+            render_span.set(trimmed_bytes=len(result.trimmed_html))
+        return result
 
-        for attr in original_attributes:
-            if attr not in allowed_attrs:
-                del tag[attr]
+    # Trimming a multi-megabyte DOM is CPU-bound; keep it off the event loop.
+    with span("capture.trim", html_bytes=len(page_data)) as trim_span:
+        result.trimmed_html = await asyncio.to_thread(trim_html_for_llm, page_data)
+        trim_span.set(trimmed_bytes=len(result.trimmed_html))
 
-    return str(soup)
+    return result
+
+
+async def _capture_page(
+    url: str, image_path: str, scroll_policy: ScrollPolicy | None
+) -> tuple[dict | str, CaptureResult]:
+    """
+    Load, scroll and screenshot `url`. Returns the page as a DOM snapshot,
+    or its full HTML when CAPTURE_SNAPSHOT is off, with the capture result
+    still missing its trimmed_html.
+    """
+    async with browser_pool.context(viewport=DEFAULT_VIEWPORT) as context:
+        page = await context.new_page()
+        blocking = await request_blocker.install(page, url)
+        with span("capture.navigate") as navigate_span:
+            response = await page.goto(url, wait_until="domcontentloaded")
+            navigate_span.set(status=response.status if response is not None else None)
+        validators = {}
+        if response is not None:
+            for header in ("etag", "last-modified"):
+                if header in response.headers:
+                    validators[header] = response.headers[header]
+
+        # Scroll down the page to trigger lazy-loaded content
+        with span("capture.scroll") as scroll_span:
+            stats = await scroll_until_settled(page, scroll_policy)
+            scroll_span.set(steps=stats.steps, height=stats.final_height, stop_reason=stats.stop_reason)
+        print(
+            f"[+] Scrolled {stats.steps} steps in {stats.elapsed_ms} ms "
+            f"({stats.stop_reason}, height {stats.final_height}px)"
+        )
+
+        # Ensure the directory exists before saving the screenshot
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        with span("capture.screenshot") as screenshot_span:
+            await page.screenshot(path=image_path, full_page=True)
+            screenshot_span.set(image_bytes=os.path.getsize(image_path))
+        print(f"[+] Screenshot saved to {image_path}")
+
+        with span("capture.extract") as extract_span:
+            if CAPTURE_SNAPSHOT:
+                # The visible elements, their boxes and resolved image URLs in a single round-trip
+                snapshot = await page.evaluate(DOM_SNAPSHOT_SCRIPT, CAPTURE_SNAPSHOT_MAX_NODES)
+                page_data, base_url, image_sources = snapshot, snapshot["base_url"], snapshot["images"]
+                extract_span.set(nodes=len(snapshot["nodes"]), images=len(image_sources))
+            else:
+                html = await page.content()
+                # One round-trip for every image source, plus the URL they are relative to
+                images = await page.evaluate(_IMAGE_SOURCES_SCRIPT)
+                page_data, base_url, image_sources = html, images["base_url"], images["sources"]
+                extract_span.set(html_bytes=len(html), images=len(image_sources))
+
+        request_stats = blocking.as_dict()
+        print(
+            f"[+] {request_stats['requests']} requests, {request_stats['blocked']} blocked by the "
+            f"{request_stats['profile']} profile, {request_stats['bytes_loaded'] / 1024:.0f} KB loaded"
+        )
+
+        return page_data, CaptureResult(
+            trimmed_html="",
+            image_sources=image_sources,
+            base_url=base_url,
+            validators=validators,
+            scroll_stats=stats,
+            request_stats=request_stats,
+        )
 
 
 # python agents/utils/playwright_screenshot.py
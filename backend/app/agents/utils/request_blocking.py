@@ -0,0 +1,189 @@
+import os
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from app.agents.utils.metrics import Counter
+
+# Which requests captures block: "fast", "fidelity" or "off"
+CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "fidelity").lower()
+# Extra tracker domains, one per line; hosts-file lines ("0.0.0.0 example.com") work too
+CAPTURE_BLOCKLIST = os.getenv("CAPTURE_BLOCKLIST", "")
+
+# Analytics, tag managers, ad networks and session recorders that never change
+# how a page looks. Subdomains are blocked along with them.
+DEFAULT_TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com", "doubleclick.net",
+    "googlesyndication.com", "googleadservices.com", "adservice.google.com", "analytics.google.com",
+    "facebook.net", "connect.facebook.net", "ads-twitter.com", "analytics.twitter.com", "static.ads-twitter.com",
+    "snap.licdn.com", "bat.bing.com", "clarity.ms", "hotjar.com", "hotjar.io",
+    "fullstory.com", "segment.com", "segment.io", "cdn.segment.com", "mixpanel.com", "amplitude.com",
+    "heap.io", "heapanalytics.com", "intercomcdn.com", "optimizely.com", "newrelic.com", "nr-data.net",
+    "sentry.io", "browser.sentry-cdn.com", "quantserve.com", "scorecardresearch.com", "criteo.com",
+    "criteo.net", "taboola.com", "outbrain.com", "adnxs.com", "rubiconproject.com", "pubmatic.com",
+    "casalemedia.com", "moatads.com", "amazon-adsystem.com", "analytics.tiktok.com",
+    "cookielaw.org", "onetrust.com", "cookiebot.com", "trustarc.com", "mc.yandex.ru",
+    "matomo.cloud", "plausible.io", "stats.wp.com", "pixel.wp.com",
+)
+
+blocked_requests = Counter(
+    "capture_blocked_requests_total", "Requests a capture's profile kept from loading", ("profile", "reason")
+)
+
+
+class DomainBlocklist:
+    """
+    A set of domains, matched against a host and each of its parent domains:
+    blocking example.com also blocks ads.example.com. A lookup costs one set
+    probe per label in the host, however long the list is.
+    """
+
+    def __init__(self, domains=()):
+        self.domains: set[str] = set()
+        for domain in domains:
+            self.add(domain)
+
+    def add(self, domain: str):
+        domain = domain.strip().lower().rstrip(".")
+        if domain:
+            self.domains.add(domain)
+
+    def load(self, path: str):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.split("#", 1)[0].split()
+                if line:
+                    # "example.com" or "0.0.0.0 example.com"
+                    self.add(line[-1])
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def __contains__(self, host: str) -> bool:
+        host = host.lower().rstrip(".")
+        while host:
+            if host in self.domains:
+                return True
+            _, _, host = host.partition(".")
+        return False
+
+
+def _site(host: str) -> str:
+    # Close enough to the registrable domain to tell first from third party here
+    return ".".join(host.split(".")[-2:])
+
+
+@dataclass(frozen=True)
+class CaptureProfile:
+    name: str
+    block_trackers: bool = False
+    # Playwright resource types that are never loaded
+    blocked_types: frozenset[str] = frozenset()
+    block_third_party_frames: bool = False
+
+    @property
+    def intercepts(self) -> bool:
+        return self.block_trackers or bool(self.blocked_types) or self.block_third_party_frames
+
+
+PROFILES = {
+    # Screenshot-relevant requests only: no trackers, media, web fonts or third-party embeds
+    "fast": CaptureProfile(
+        "fast",
+        block_trackers=True,
+        blocked_types=frozenset({"media", "font", "beacon", "eventsource", "websocket", "manifest"}),
+        block_third_party_frames=True,
+    ),
+    # Everything that can change how the page looks still loads
+    "fidelity": CaptureProfile("fidelity", block_trackers=True),
+    "off": CaptureProfile("off"),
+}
+
+
+@dataclass
+class BlockingStats:
+    """What a capture's profile blocked and what it let through."""
+
+    profile: str
+    requests: int = 0
+    blocked: dict[str, int] = field(default_factory=dict)
+    # Response bytes as declared by Content-Length; chunked responses aren't counted
+    bytes_loaded: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "profile": self.profile,
+            "requests": self.requests,
+            "blocked": sum(self.blocked.values()),
+            "blocked_by_reason": dict(self.blocked),
+            "bytes_loaded": self.bytes_loaded,
+        }
+
+
+class RequestBlocker:
+    """Decides, per request, whether a capture under `profile` should load it."""
+
+    def __init__(self, profile: CaptureProfile, blocklist: DomainBlocklist):
+        self.profile = profile
+        self.blocklist = blocklist
+
+    def block_reason(self, url: str, resource_type: str, page_host: str, subframe: bool) -> str | None:
+        """Why the request should be blocked ("tracker", "third_party_frame" or its type), or None."""
+        host = urlsplit(url).hostname or ""
+        if self.profile.block_trackers and host and host in self.blocklist:
+            return "tracker"
+        if resource_type in self.profile.blocked_types:
+            return resource_type
+        if (
+            self.profile.block_third_party_frames
+            and subframe
+            and resource_type == "document"
+            and _site(host) != _site(page_host)
+        ):
+            return "third_party_frame"
+        return None
+
+    async def install(self, page, url: str) -> BlockingStats:
+        """Route `page`'s requests through this blocker. Returns the stats it keeps filling in."""
+        stats = BlockingStats(self.profile.name)
+        page_host = urlsplit(url).hostname or ""
+
+        def on_response(response):
+            length = response.headers.get("content-length")
+            if length and length.isdigit():
+                stats.bytes_loaded += int(length)
+
+        page.on("response", on_response)
+        if not self.profile.intercepts:
+            page.on("request", lambda request: setattr(stats, "requests", stats.requests + 1))
+            return stats
+
+        async def handle(route):
+            request = route.request
+            stats.requests += 1
+            subframe = request.resource_type == "document" and request.frame.parent_frame is not None
+            # The page itself always loads, redirects included.
+            main_document = request.resource_type == "document" and not subframe
+            reason = None if main_document else self.block_reason(request.url, request.resource_type, page_host, subframe)
+            if reason is None:
+                await route.continue_()
+                return
+            stats.blocked[reason] = stats.blocked.get(reason, 0) + 1
+            blocked_requests.inc(profile=self.profile.name, reason=reason)
+            await route.abort("blockedbyclient")
+
+        await page.route("**/*", handle)
+        return stats
+
+
+def load_blocklist(path: str = CAPTURE_BLOCKLIST) -> DomainBlocklist:
+    blocklist = DomainBlocklist(DEFAULT_TRACKER_DOMAINS)
+    if path:
+        blocklist.load(path)
+        print(f"[+] Loaded capture blocklist from {path}: {len(blocklist)} domains")
+    return blocklist
+
+
+if CAPTURE_PROFILE not in PROFILES:
+    raise ValueError(f"CAPTURE_PROFILE must be one of {', '.join(PROFILES)}, not {CAPTURE_PROFILE!r}")
+
+request_blocker = RequestBlocker(PROFILES[CAPTURE_PROFILE], load_blocklist())
@@ -0,0 +1,177 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import AsyncIterator
+
+# Concurrent browser captures and LLM calls across all runs
+CAPTURE_CONCURRENCY = int(os.getenv("CAPTURE_CONCURRENCY", "2"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# Admission control for whole agent runs
+SCHEDULER_MAX_RUNNING = int(os.getenv("SCHEDULER_MAX_RUNNING", "8"))
+SCHEDULER_MAX_QUEUED = int(os.getenv("SCHEDULER_MAX_QUEUED", "32"))
+SCHEDULER_MAX_QUEUED_PER_CLIENT = int(os.getenv("SCHEDULER_MAX_QUEUED_PER_CLIENT", "4"))
+
+
+class ConcurrencyPool:
+    """A named semaphore that also reports how many holders and waiters it has."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._semaphore.release()
+
+    async def run(self, coro):
+        """Await `coro` while holding a slot."""
+        async with self:
+            return await coro
+
+
+capture_slots = ConcurrencyPool("capture", CAPTURE_CONCURRENCY)
+llm_slots = ConcurrencyPool("llm", LLM_CONCURRENCY)
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many queued runs, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A run's place in the scheduler: queued until granted, then running until released."""
+
+    def __init__(self, scheduler: "JobScheduler", client_id: str):
+        self.scheduler = scheduler
+        self.client_id = client_id
+        self.granted = False
+        self.released = False
+        self.started_at: float | None = None
+
+    async def wait(self) -> AsyncIterator[int]:
+        """Yield the 1-based queue position each time it changes, until the run may start."""
+        last_position = None
+        while not self.granted:
+            position = self.scheduler.position(self)
+            if position != last_position:
+                last_position = position
+                yield position
+            await self.scheduler.changed()
+
+    def release(self):
+        self.scheduler._release(self)
+
+
+class JobScheduler:
+    """
+    Admission control for agent runs. At most `max_running` runs execute at
+    once. Further runs wait in a bounded queue that is served round-robin by
+    client, so one client with many requests can't starve the others. admit()
+    raises QueueFull, with a Retry-After estimate, once `max_queued` runs are
+    waiting overall or `max_queued_per_client` for one client.
+    """
+
+    def __init__(
+        self,
+        max_running: int = SCHEDULER_MAX_RUNNING,
+        max_queued: int = SCHEDULER_MAX_QUEUED,
+        max_queued_per_client: int = SCHEDULER_MAX_QUEUED_PER_CLIENT,
+        expected_run_seconds: float = 30.0,
+    ):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.running = 0
+        self.queued = 0
+        # Client -> waiting tickets; the dict order is the round-robin order.
+        self._queues: OrderedDict[str, deque[Ticket]] = OrderedDict()
+        # Moving average of run durations, for Retry-After
+        self._average_run_seconds = expected_run_seconds
+        self._changed = asyncio.Event()
+
+    def admit(self, client_id: str) -> Ticket:
+        queue = self._queues.get(client_id)
+        if self.running >= self.max_running or self.queued:
+            if self.queued >= self.max_queued or (queue and len(queue) >= self.max_queued_per_client):
+                raise QueueFull(self.retry_after())
+
+        ticket = Ticket(self, client_id)
+        if queue is None:
+            queue = self._queues[client_id] = deque()
+        queue.append(ticket)
+        self.queued += 1
+        self._dispatch()
+        return ticket
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to open up for a new run."""
+        return max(1, math.ceil(self._average_run_seconds * (self.queued + 1) / self.max_running))
+
+    def position(self, ticket: Ticket) -> int:
+        """How many runs will start before `ticket`, plus one, under round-robin dispatch."""
+        clients = list(self._queues)
+        own_index = self._queues[ticket.client_id].index(ticket)
+        own_turn = clients.index(ticket.client_id)
+        ahead = own_index
+        for turn, client in enumerate(clients):
+            if client != ticket.client_id:
+                # Clients earlier in the rotation get one more turn before ours.
+                ahead += min(len(self._queues[client]), own_index + (turn < own_turn))
+        return ahead + 1
+
+    async def changed(self):
+        await self._changed.wait()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _dispatch(self):
+        while self.running < self.max_running and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client_id)
+            else:
+                del self._queues[client_id]
+            self.queued -= 1
+            self.running += 1
+            ticket.granted = True
+            ticket.started_at = time.monotonic()
+        self._notify()
+
+    def _release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self.running -= 1
+            elapsed = time.monotonic() - ticket.started_at
+            self._average_run_seconds = 0.8 * self._average_run_seconds + 0.2 * elapsed
+        else:
+            # Gave up while queued, e.g. the client disconnected.
+            queue = self._queues[ticket.client_id]
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.client_id]
+            self.queued -= 1
+        self._dispatch()
+
+
+scheduler = JobScheduler()
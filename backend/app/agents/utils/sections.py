@@ -0,0 +1,198 @@
+import os
+import re
+import html as html_lib
+from dataclasses import dataclass
+
+from bs4 import BeautifulSoup, Tag
+
+# Sectioned cloning: long pages are split into vertical regions that are
+# generated concurrently and stitched back together.
+CLONE_SECTIONED = os.getenv("CLONE_SECTIONED", "0") == "1"
+CLONE_SECTION_CONCURRENCY = int(os.getenv("CLONE_SECTION_CONCURRENCY", "4"))
+CLONE_MAX_SECTIONS = int(os.getenv("CLONE_MAX_SECTIONS", "6"))
+# Regions shorter than this are merged with their neighbours (CSS px)
+CLONE_MIN_SECTION_HEIGHT = int(os.getenv("CLONE_MIN_SECTION_HEIGHT", "600"))
+
+# Containers that are split into their children rather than kept whole
+_CONTAINER_TAGS = frozenset({"main", "article", "div"})
+
+
+@dataclass
+class Section:
+    index: int
+    # Vertical extent on the page, in CSS px
+    top: int
+    bottom: int
+    page_height: int
+    # The region's elements, as trimmed HTML
+    html: str
+    # Tag names of the region's top-level elements, e.g. ["header", "nav"]
+    landmarks: list[str]
+
+
+def _box(tag: Tag) -> tuple[int, int, int, int] | None:
+    try:
+        x, y, width, height = (int(value) for value in tag["data-box"].split(","))
+    except (KeyError, ValueError):
+        return None
+    return x, y, width, height
+
+
+def _boxed_children(tag: Tag) -> list[Tag]:
+    return [child for child in tag.children if isinstance(child, Tag) and (box := _box(child)) and box[3] > 0]
+
+
+def plan_sections(
+    html: str,
+    max_sections: int = CLONE_MAX_SECTIONS,
+    min_height: int = CLONE_MIN_SECTION_HEIGHT,
+) -> list[Section]:
+    """
+    Split a captured page (snapshot HTML with data-box attributes) into at
+    most `max_sections` vertical regions along its landmarks: header, hero,
+    content sections, footer. Returns no sections when the page is too short
+    or has no boxes to split on.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    body = soup.body
+    page_box = _box(body) if body is not None else None
+    if page_box is None or page_box[3] < 2 * min_height:
+        return []
+
+    # Look through wrapper elements down to the level where the page branches.
+    node = body
+    while len(children := _boxed_children(node)) == 1:
+        node = children[0]
+
+    # Open up containers taller than half the page, e.g. <main>, one level.
+    candidates: list[Tag] = []
+    for child in children:
+        grandchildren = _boxed_children(child)
+        if child.name in _CONTAINER_TAGS and len(grandchildren) > 1 and _box(child)[3] > page_box[3] / 2:
+            candidates.extend(grandchildren)
+        else:
+            candidates.append(child)
+    if len(candidates) < 2:
+        return []
+
+    # Consecutive elements, grouped until each group is at least min_height tall
+    groups: list[list[Tag]] = []
+    for candidate in candidates:
+        if groups and _extent(groups[-1])[1] - _extent(groups[-1])[0] < min_height:
+            groups[-1].append(candidate)
+        else:
+            groups.append([candidate])
+    if len(groups) > 1 and _extent(groups[-1])[1] - _extent(groups[-1])[0] < min_height:
+        groups[-2].extend(groups.pop())
+
+    # Too many regions: merge the shortest neighbouring pair until they fit.
+    while len(groups) > max(1, max_sections):
+        heights = [_extent(groups[i] + groups[i + 1]) for i in range(len(groups) - 1)]
+        shortest = min(range(len(heights)), key=lambda i: heights[i][1] - heights[i][0])
+        groups[shortest:shortest + 2] = [groups[shortest] + groups[shortest + 1]]
+    if len(groups) < 2:
+        return []
+
+    return [
+        Section(
+            index=index,
+            top=_extent(group)[0],
+            bottom=_extent(group)[1],
+            page_height=page_box[3],
+            html="".join(str(tag) for tag in group),
+            landmarks=[tag.name for tag in group],
+        )
+        for index, group in enumerate(groups)
+    ]
+
+
+def _extent(group: list[Tag]) -> tuple[int, int]:
+    boxes = [_box(tag) for tag in group]
+    return min(box[1] for box in boxes), max(box[1] + box[3] for box in boxes)
+
+
+_TITLE = re.compile(r"<title>(.*?)</title>", re.S)
+
+
+def page_title(html: str) -> str:
+    match = _TITLE.search(html)
+    return html_lib.unescape(match.group(1)).strip() if match else ""
+
+
+def split_css_blocks(css: str) -> list[str]:
+    """Top-level rules and at-rules of `css`, comments dropped and whitespace collapsed."""
+    blocks = []
+    current: list[str] = []
+    depth = 0
+    quote = None
+    i = 0
+    while i < len(css):
+        char = css[i]
+        if quote:
+            current.append(char)
+            if char == "\\" and i + 1 < len(css):
+                current.append(css[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = len(css) if end == -1 else end + 2
+            continue
+        elif char in "\"'":
+            quote = char
+            current.append(char)
+        elif char == "{":
+            depth += 1
+            current.append(char)
+        elif char == "}":
+            depth = max(depth - 1, 0)
+            current.append(char)
+            if depth == 0:
+                blocks.append(" ".join("".join(current).split()))
+                current = []
+        elif char == ";" and depth == 0:
+            # Statements like @import or @charset
+            current.append(char)
+            blocks.append(" ".join("".join(current).split()))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    return [block for block in blocks if block]
+
+
+# Whitespace that doesn't change a rule's meaning
+_CSS_PUNCTUATION_SPACE = re.compile(r"\s*([{};])\s*")
+
+
+def merge_css(stylesheets: list[str]) -> str:
+    """
+    Concatenate the sections' stylesheets, keeping the first copy of every
+    rule that more than one section emitted (resets, body, shared classes).
+    @import and @charset rules go first, as CSS requires.
+    """
+    seen = set()
+    statements, rules = [], []
+    for css in stylesheets:
+        for block in split_css_blocks(css):
+            key = _CSS_PUNCTUATION_SPACE.sub(r"\1", block).replace(";}", "}")
+            if key in seen:
+                continue
+            seen.add(key)
+            (statements if block.startswith(("@import", "@charset")) else rules).append(block)
+    return "\n".join(statements + rules)
+
+
+def stitch_sections(title: str, fragments: list[str]) -> str:
+    """One page.html with the sections' markup in order, linked to page.css."""
+    soup = BeautifulSoup(
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+        "<title></title><link rel=\"stylesheet\" href=\"page.css\"></head><body></body></html>",
+        "html.parser",
+    )
+    soup.title.string = title
+    for fragment in fragments:
+        soup.body.append(BeautifulSoup(fragment, "html.parser"))
+    return str(soup)
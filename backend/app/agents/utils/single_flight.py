@@ -0,0 +1,53 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Runs at most one call per key at a time. Callers asking for a key that is
+    already in flight wait for that call and share its result or exception
+    instead of starting their own.
+
+    The call runs as its own task, so any one caller can leave without
+    affecting the rest; it is cancelled only once every caller has left.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Return the result of `call()` for `key`, and whether it was shared with an earlier caller."""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # The last caller left; nobody wants the result any more.
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight):
+        # A new flight may have started under the same key since this one was cancelled.
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator
+
+import orjson
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from app.agents.utils.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+# Bump when an event's shape changes incompatibly
+STREAM_PROTOCOL_VERSION = 1
+
+# Token deltas are buffered and sent at most this often, and at the latest
+# this long after the first buffered token even if the model stalls
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+# Log every Nth event of a request (0 disables), truncated to this many characters
+STREAM_LOG_EVERY = int(os.getenv("STREAM_LOG_EVERY", "25"))
+STREAM_LOG_MAX_CHARS = int(os.getenv("STREAM_LOG_MAX_CHARS", "300"))
+
+# Tool arguments are echoed in tool_start events only up to this length
+_MAX_ARG_CHARS = 200
+
+
+def encode_event(event: dict) -> bytes:
+    """One server-sent event carrying `event` as compact JSON."""
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+def encode_ndjson(event: dict) -> bytes:
+    """`event` as one line of newline-delimited JSON."""
+    return orjson.dumps(event) + b"\n"
+
+
+class EventTranslator:
+    """
+    Turns LangGraph `(mode, chunk)` stream items from the "updates", "messages"
+    and "custom" modes into protocol events:
+
+        {"t": "delta", "text": ...}                       assistant tokens, batched
+        {"t": "tool_start", "id", "name", "args"}         long arguments elided
+        {"t": "tool_end", "id", "name", "status", "ms"}
+        {"t": "stage", "name", "ms"}                      a graph node finished
+        {"t": <custom type>, ...}                         events written by nodes and
+                                                          tools, e.g. "artifact"
+    """
+
+    def __init__(self, flush_ms: float = STREAM_FLUSH_MS):
+        self.flush_seconds = flush_ms / 1000
+        self.pending_text: list[str] = []
+        self.last_flush = time.perf_counter()
+        self.stage_started = time.perf_counter()
+        self.tool_started: dict[str, float] = {}
+
+    def translate(self, mode: str, chunk: Any) -> list[dict]:
+        if mode == "messages":
+            message, metadata = chunk
+            if isinstance(message, AIMessageChunk) and isinstance(message.content, str) and message.content:
+                self.pending_text.append(message.content)
+                if time.perf_counter() - self.last_flush >= self.flush_seconds:
+                    return self.flush()
+            return []
+
+        # Anything else is a boundary: send buffered text first to keep the order.
+        events = self.flush()
+        if mode == "custom":
+            event = {"t": chunk.get("type", "custom")}
+            event.update((key, value) for key, value in chunk.items() if key != "type")
+            events.append(event)
+        elif mode == "updates":
+            for node, update in chunk.items():
+                events.extend(self._node_events(node, update))
+        return events
+
+    def _node_events(self, node: str, update: dict | None) -> list[dict]:
+        now = time.perf_counter()
+        events = [{"t": "stage", "name": node, "ms": round((now - self.stage_started) * 1000)}]
+        self.stage_started = now
+
+        for message in (update or {}).get("messages", []):
+            if isinstance(message, AIMessage):
+                for call in message.tool_calls:
+                    self.tool_started[call["id"]] = now
+                    events.append({"t": "tool_start", "id": call["id"], "name": call["name"], "args": _short_args(call["args"])})
+            elif isinstance(message, ToolMessage):
+                started = self.tool_started.pop(message.tool_call_id, now)
+                events.append({
+                    "t": "tool_end",
+                    "id": message.tool_call_id,
+                    "name": message.name,
+                    "status": message.status,
+                    "ms": round((now - started) * 1000),
+                })
+        return events
+
+    def flush_due_in(self) -> float | None:
+        """Seconds until buffered text is due to go out, or None when nothing is buffered."""
+        if not self.pending_text:
+            return None
+        return max(self.flush_seconds - (time.perf_counter() - self.last_flush), 0)
+
+    def flush(self) -> list[dict]:
+        self.last_flush = time.perf_counter()
+        if not self.pending_text:
+            return []
+        text = "".join(self.pending_text)
+        self.pending_text = []
+        return [{"t": "delta", "text": text}]
+
+
+def _short_args(args: dict) -> dict:
+    short = {}
+    for key, value in args.items():
+        size = len(orjson.dumps(value, default=str))
+        short[key] = value if size <= _MAX_ARG_CHARS else f"<{size} chars>"
+    return short
+
+
+async def encode_graph_stream(stream: AsyncIterator, request_id: str, trace: Trace | None = None) -> AsyncIterator[bytes]:
+    """
+    Translate and encode a LangGraph stream, logging a capped sample of the
+    events. Spans finished in `trace` go out as "timing" events along the way.
+    Buffered text is also flushed on a deadline, so a model that stalls
+    mid-sentence doesn't hold back what it has already written.
+    """
+    translator = EventTranslator()
+    chunks: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        # The graph runs in a task of its own, so a flush deadline never interrupts it.
+        try:
+            async with aclosing(stream) as items:
+                async for item in items:
+                    chunks.put_nowait(item)
+        except Exception as e:
+            chunks.put_nowait(e)
+        finally:
+            chunks.put_nowait(end)
+
+    producer = asyncio.create_task(pump())
+    count = 0
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(chunks.get(), translator.flush_due_in())
+            except TimeoutError:
+                events = translator.flush()
+            else:
+                if item is end:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                events = translator.translate(*item)
+            if trace is not None:
+                events = trace.drain() + events
+            for event in events:
+                count += 1
+                if STREAM_LOG_EVERY and (count - 1) % STREAM_LOG_EVERY == 0:
+                    logger.info(f"[{request_id}] Event #{count}: {str(event)[:STREAM_LOG_MAX_CHARS]}")
+                yield encode_event(event)
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.wait({producer})
+    for event in translator.flush() + (trace.drain() if trace is not None else []):
+        yield encode_event(event)
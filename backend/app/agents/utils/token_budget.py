@@ -0,0 +1,209 @@
+import os
+import re
+import bisect
+import functools
+
+import tiktoken
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+# Default token budget for the trimmed HTML pasted into the clone prompt
+CLONE_HTML_TOKEN_BUDGET = int(os.getenv("CLONE_HTML_TOKEN_BUDGET", "30000"))
+
+
+# Rough size of a token when no tiktoken encoding is available
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding | None:
+    """
+    The tokenizer for `model`, or None when it can't be loaded: tiktoken
+    downloads encodings on first use, which fails on an offline cold cache.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Every current OpenAI chat model uses o200k_base.
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"[!] No tiktoken encoding for {model}, estimating tokens from characters: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "o3") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def reduce_html_to_token_budget(html: str, max_tokens: int, model: str = "o3") -> tuple[str, int, int]:
+    """
+    Shrink trimmed HTML until it fits in `max_tokens`, losing as little of what
+    the clone needs as possible. Returns the reduced HTML and the token counts
+    before and after.
+
+    Stages, each applied only while the page is still over budget:
+      1. drop comments and whitespace-only text nodes
+      2. collapse runs of structurally identical siblings (list items, card
+         grids) to a few samples plus a comment saying how many were omitted
+      3. shorten long text nodes
+      4. repeat 2 and 3 more aggressively
+      5. drop what sits lowest on the page
+    Stage 5 only removes content; nothing is reordered. Position comes from the
+    data-box attributes of a DOM snapshot, so the elements that start lowest on
+    the page go first even when the markup isn't in visual order. HTML without
+    boxes is cut from the end, DOM order standing in for page position.
+    """
+    before = count_tokens(html, model)
+    if before <= max_tokens:
+        return html, before, before
+
+    soup = BeautifulSoup(html, "html.parser")
+    _remove_blank_nodes(soup)
+    reduced = str(soup)
+    tokens = count_tokens(reduced, model)
+
+    for keep_samples, max_text_chars in ((3, 300), (1, 80)):
+        if tokens <= max_tokens:
+            break
+        _collapse_repeated_siblings(soup, keep_samples)
+        _shorten_text_nodes(soup, max_text_chars)
+        reduced = str(soup)
+        tokens = count_tokens(reduced, model)
+
+    # The cut is estimated, so a second or third pass may be needed to get under budget.
+    for _ in range(3):
+        if tokens <= max_tokens or (dropped := _drop_below(soup, reduced, tokens, max_tokens, model)) is None:
+            break
+        reduced, tokens = dropped
+    if tokens > max_tokens:
+        reduced, tokens = _truncate_tail(reduced, max_tokens, model)
+
+    return reduced, before, tokens
+
+
+_DROPPED_MARKER = " content below {}px omitted to fit the token budget "
+
+
+def _remove_blank_nodes(soup: BeautifulSoup):
+    for node in soup.find_all(string=True):
+        if isinstance(node, Comment) or not node.strip():
+            # Whitespace is meaningful inside <pre>.
+            if not isinstance(node, Comment) and node.find_parent("pre"):
+                continue
+            node.extract()
+
+
+_OMITTED_NOTE = re.compile(r" (\d+) more <[^>]+> elements like the above omitted ")
+
+
+def _signature(tag: Tag) -> tuple:
+    """Tags with the same name and the same child tag sequence are 'the same structure'."""
+    return (tag.name, tuple(child.name for child in tag.children if isinstance(child, Tag)))
+
+
+def _collapse_repeated_siblings(soup: BeautifulSoup, keep_samples: int):
+    # Children before parents, so nested lists collapse before their containers compare.
+    for parent in reversed(soup.find_all(True)):
+        children = [child for child in parent.children if isinstance(child, Tag)]
+        run: list[Tag] = []
+        for child in children + [None]:
+            if child is not None and run and _signature(child) == _signature(run[0]):
+                run.append(child)
+                continue
+            if len(run) > keep_samples:
+                omitted = run[keep_samples:]
+                count = len(omitted)
+                # Fold in the note left by an earlier, gentler pass over this run.
+                note = omitted[-1].find_next_sibling(string=_OMITTED_NOTE.match)
+                if note is not None and note.find_previous_sibling(True) is omitted[-1]:
+                    count += int(_OMITTED_NOTE.match(note).group(1))
+                    note.extract()
+                omitted[0].insert_before(Comment(f" {count} more <{run[0].name}> elements like the above omitted "))
+                for tag in omitted:
+                    tag.decompose()
+            run = [child] if child is not None else []
+
+
+def _shorten_text_nodes(soup: BeautifulSoup, max_chars: int):
+    for node in soup.find_all(string=True):
+        if isinstance(node, Comment) or len(node) <= max_chars:
+            continue
+        node.replace_with(NavigableString(node[:max_chars].rstrip() + "…"))
+
+
+def _box_top(tag: Tag) -> int | None:
+    try:
+        return int(tag["data-box"].split(",")[1])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _drop_below(soup: BeautifulSoup, html: str, tokens: int, max_tokens: int, model: str) -> tuple[str, int] | None:
+    """
+    Remove, in place, every element of `soup` (serialized as `html`, `tokens`
+    long) that starts at or below the lowest page cutoff estimated to fit in
+    `max_tokens`. Returns the new HTML and its token count, which may still be
+    over budget when the estimate was off or the first screen alone is too
+    long. None for HTML without data-box attributes.
+
+    The page is serialized and tokenized once more, after the cut: the size of
+    each element is measured once, and the size at every cutoff follows from
+    the tokens-per-character ratio of the whole document.
+    """
+    # (element, its top, the lowest top among its boxed ancestors)
+    boxed = []
+    tops_by_element = {}
+    for tag in soup.find_all(attrs={"data-box": True}):
+        top = _box_top(tag)
+        if tag.name == "body" or top is None:
+            continue
+        ancestor_tops = [tops_by_element[id(parent)] for parent in tag.parents if id(parent) in tops_by_element]
+        boxed.append((tag, top, max(ancestor_tops, default=-1)))
+        tops_by_element[id(tag)] = top
+    cutoffs = sorted({top for _, top, _ in boxed if top > 0})
+    if not cutoffs:
+        return None
+
+    # An element is removed whole, as the outermost removed one, by every
+    # cutoff in (its ancestors' lowest top, its top]: add its size over that range.
+    removed_chars = [0] * (len(cutoffs) + 1)
+    for tag, top, ancestor_top in boxed:
+        first, end = bisect.bisect_right(cutoffs, ancestor_top), bisect.bisect_right(cutoffs, top)
+        if first < end:
+            size = len(str(tag))
+            removed_chars[first] += size
+            removed_chars[end] -= size
+    tokens_per_char = tokens / max(len(html), 1)
+    marker_chars = len(_DROPPED_MARKER) + 16
+    cutoff = cutoffs[0]
+    removed = 0
+    for index, candidate in enumerate(cutoffs):
+        removed += removed_chars[index]
+        if (len(html) - removed + marker_chars) * tokens_per_char > max_tokens:
+            break
+        cutoff = candidate
+
+    for tag, top, ancestor_top in boxed:
+        if ancestor_top < cutoff <= top:
+            tag.decompose()
+    # One marker, for the latest pass
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment) and text.endswith(_DROPPED_MARKER[-30:])):
+        comment.extract()
+    if soup.body is not None:
+        soup.body.append(Comment(_DROPPED_MARKER.format(cutoff)))
+    reduced = str(soup)
+    return reduced, count_tokens(reduced, model)
+
+
+def _truncate_tail(html: str, max_tokens: int, model: str) -> tuple[str, int]:
+    marker = "\n<!-- remainder of the page truncated to fit the token budget -->"
+    encoding = get_encoding(model)
+    keep = max(max_tokens - count_tokens(marker, model), 0)
+    if encoding is None:
+        truncated = html[:keep * CHARS_PER_TOKEN] + marker
+    else:
+        truncated = encoding.decode(encoding.encode(html, disallowed_special=())[:keep]) + marker
+    return truncated, count_tokens(truncated, model)
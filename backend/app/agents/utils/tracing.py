@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+
+from app.agents.utils.metrics import BYTE_BUCKETS, TOKEN_BUCKETS, Counter, Histogram
+
+# Set to 0 to turn spans into no-ops: no timing events and no stage histograms
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+
+stage_seconds = Histogram("clone_stage_duration_seconds", "Time spent in each stage of a run", ("stage",))
+stage_bytes = Histogram("clone_stage_payload_bytes", "Payload sizes seen by each stage", ("stage", "payload"), buckets=BYTE_BUCKETS)
+stage_tokens = Histogram("clone_stage_tokens", "Token counts seen by each stage", ("stage", "kind"), buckets=TOKEN_BUCKETS)
+stage_cancelled = Counter("clone_stage_cancelled_total", "Stages cut short because their run was cancelled", ("stage",))
+
+
+class Trace:
+    """
+    The spans finished during one request, waiting to be sent on its event
+    stream. Spans may finish on other threads, e.g. the browser pool's.
+    """
+
+    def __init__(self):
+        self._events: deque[dict] = deque()
+
+    def add(self, event: dict):
+        self._events.append(event)
+
+    def drain(self) -> list[dict]:
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def start_trace() -> Trace:
+    """Collect the spans of everything run from the current context (and tasks it starts) in a new Trace."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    _current_trace.set(None)
+
+
+def bind_trace(coro):
+    """Wrap `coro` so it records into the current trace even when run on another event loop."""
+    trace = _current_trace.get()
+
+    async def traced():
+        _current_trace.set(trace)
+        return await coro
+
+    return traced()
+
+
+class Span:
+    """
+    Times a `with` block as stage `name`. Attributes ending in `_bytes` or
+    `_tokens` also feed the payload histograms; all of them go into the
+    {"t": "timing", ...} event sent to the client.
+    """
+
+    __slots__ = ("name", "attributes", "trace", "started")
+
+    def __init__(self, name: str, attributes: dict, trace: Trace | None):
+        self.name = name
+        self.attributes = attributes
+        self.trace = trace
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        stage_seconds.observe(seconds, stage=self.name)
+        if exc_type is asyncio.CancelledError:
+            stage_cancelled.inc(stage=self.name)
+        for key, value in self.attributes.items():
+            if not isinstance(value, (int, float)):
+                continue
+            if key.endswith("_bytes"):
+                stage_bytes.observe(value, stage=self.name, payload=key[:-6])
+            elif key.endswith("_tokens"):
+                stage_tokens.observe(value, stage=self.name, kind=key[:-7])
+        if self.trace is not None:
+            event = {"t": "timing", "name": self.name, "ms": round(seconds * 1000, 1)}
+            event.update(self.attributes)
+            if exc_type is not None:
+                event["error"] = exc_type.__name__
+            self.trace.add(event)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes) -> Span | _NoopSpan:
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attributes, _current_trace.get())
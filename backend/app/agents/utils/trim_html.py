@@ -0,0 +1,177 @@
+from html.parser import HTMLParser
+
+from bs4.builder import HTMLTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.dammit import EntitySubstitution
+
+# Tags removed together with everything inside them
+BLACKLISTED_TAGS = frozenset(
+    ['script', 'meta', 'noscript', 'iframe', 'svg', 'canvas', 'video', 'audio', 'link', 'style']
+)
+
+# Only allow a minimal set of attributes
+ALLOWED_ATTRS = frozenset({"src", "href", "alt", "title"})
+
+_VOID_TAGS = HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+_PRESERVE_WHITESPACE_TAGS = HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+def trim_html_for_llm(
+    html: str,
+    blacklisted_tags: frozenset[str] = BLACKLISTED_TAGS,
+    allowed_attrs: frozenset[str] = ALLOWED_ATTRS,
+) -> str:
+    """
+    Drop blacklisted subtrees and all but the allowed attributes in a single
+    streaming pass over `html`, without building a tree.
+
+    The output is byte-for-byte what parsing with BeautifulSoup's html.parser
+    builder, decomposing the blacklisted tags, stripping attributes and calling
+    str(soup) produced, just several times faster and with a fraction of the
+    memory on multi-megabyte pages.
+    """
+    parser = _TrimmingParser(blacklisted_tags, allowed_attrs)
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.out)
+
+
+class _TrimmingParser(HTMLParser):
+    """
+    Mirrors the tree BeautifulSoup would build (its implicit closing rules and
+    whitespace handling) using just a stack of open tag names, writing output as
+    soon as each piece is final.
+    """
+
+    def __init__(self, blacklisted_tags: frozenset[str], allowed_attrs: frozenset[str]):
+        # Like BeautifulSoup, resolve character references ourselves.
+        super().__init__(convert_charrefs=False)
+        self.blacklisted_tags = blacklisted_tags
+        self.allowed_attrs = allowed_attrs
+
+        self.out: list[str] = []
+        # Open tags as (name, skipped) pairs
+        self.stack: list[tuple[str, bool]] = []
+        self.open_counts: dict[str, int] = {}
+        # Number of open blacklisted tags; output is suppressed while > 0
+        self.skip_depth = 0
+        self.preserve_whitespace_depth = 0
+        # Void elements whose redundant end tag we should ignore, e.g. <img></img>
+        self.already_closed: list[str] = []
+        # Text accumulated since the last tag, comment or declaration
+        self.pending_text: list[str] = []
+
+    # -- text ----------------------------------------------------------------
+
+    def _take_pending(self) -> str | None:
+        if not self.pending_text:
+            return None
+        text = "".join(self.pending_text)
+        self.pending_text = []
+        # BeautifulSoup collapses whitespace-only strings outside <pre>/<textarea>.
+        if not self.preserve_whitespace_depth and all(c in _ASCII_SPACES for c in text):
+            text = "\n" if "\n" in text else " "
+        return text
+
+    def _flush_text(self):
+        text = self._take_pending()
+        if text is not None and not self.skip_depth:
+            self.out.append(EntitySubstitution.substitute_xml(text))
+
+    def _emit_special(self, prefix: str, data: str, suffix: str):
+        self._flush_text()
+        self.pending_text.append(data)
+        text = self._take_pending()
+        if not self.skip_depth:
+            self.out.append(prefix + text + suffix)
+
+    def handle_data(self, data):
+        self.pending_text.append(data)
+
+    def handle_charref(self, name):
+        dereferenced, _, extra_data = BeautifulSoupHTMLParser._dereference_numeric_character_reference(name)
+        self.pending_text.append(dereferenced)
+        self.pending_text.append(extra_data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.pending_text.append(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._emit_special("<!--", data, "-->")
+
+    def handle_decl(self, decl):
+        self._emit_special("<!DOCTYPE ", decl[len("DOCTYPE "):], ">\n")
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._emit_special("<![CDATA[", data[len("CDATA["):], "]]>")
+        else:
+            self._emit_special("<?", data, "?>")
+
+    def handle_pi(self, data):
+        self._emit_special("<?", data, ">")
+
+    # -- tags ----------------------------------------------------------------
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self._flush_text()
+
+        skipped = tag in self.blacklisted_tags
+        if skipped:
+            self.skip_depth += 1
+        elif not self.skip_depth:
+            kept = {}
+            for key, value in attrs:
+                if key in self.allowed_attrs:
+                    kept[key] = "" if value is None else value
+            parts = [tag]
+            for key, value in sorted(kept.items()):
+                value = EntitySubstitution.substitute_xml(value)
+                parts.append(f"{key}={EntitySubstitution.quoted_attribute_value(value)}")
+            self.out.append("<" + " ".join(parts) + ("/>" if tag in _VOID_TAGS else ">"))
+
+        self.stack.append((tag, skipped))
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth += 1
+
+        if tag in _VOID_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+
+        self._flush_text()
+        # Close everything up to the most recent open tag of this name, if any.
+        if not self.open_counts.get(tag):
+            return
+        while self.stack:
+            if self._pop() == tag:
+                break
+
+    def _pop(self) -> str:
+        tag, skipped = self.stack.pop()
+        self.open_counts[tag] -= 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth -= 1
+
+        if skipped:
+            self.skip_depth -= 1
+        elif not self.skip_depth and tag not in _VOID_TAGS:
+            self.out.append(f"</{tag}>")
+        return tag
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        while self.stack:
+            self._pop()
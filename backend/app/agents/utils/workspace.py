@@ -0,0 +1,197 @@
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+import weakref
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Callable
+
+from langchain_core.runnables import RunnableConfig
+
+# Files the agent reads and writes, relative to a thread's workspace
+PAGE_HTML = "page.html"
+PAGE_CSS = "page.css"
+SCREENSHOT = "screenshot-of-page-to-clone.png"
+# The captured page's image URLs, for downloading them alongside the clone
+IMAGE_MANIFEST = "images.json"
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,127}$")
+
+
+# Workspace files written by the current run, by thread_id; see record_writes()
+_written: ContextVar[dict[str, set[str]] | None] = ContextVar("workspace_writes", default=None)
+
+
+def record_writes() -> dict[str, set[str]]:
+    """
+    Note every workspace file written from the current context (and the tasks
+    it starts) from now on, so a cancelled run can find what it left behind.
+    Returns the thread_id -> file names mapping that fills up as it writes.
+    """
+    written: dict[str, set[str]] = {}
+    _written.set(written)
+    return written
+
+
+def _safe_component(value: str) -> str:
+    """A path component derived from `value` that cannot escape its parent directory."""
+    if _SAFE_NAME.match(value) and ".." not in value:
+        return value
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class Workspace(ABC):
+    """
+    The files belonging to one conversation thread. Writers replace whole files
+    and readers only ever see a complete old or new version.
+    """
+
+    def __init__(self, thread_id: str, lock: asyncio.Lock | None = None):
+        self.thread_id = thread_id
+        # Serializes read-modify-write updates within the thread
+        self.lock = lock or asyncio.Lock()
+
+    @abstractmethod
+    async def read(self, name: str) -> bytes | None:
+        pass
+
+    @abstractmethod
+    async def write(self, name: str, data: bytes | str):
+        pass
+
+    @abstractmethod
+    async def delete(self, name: str):
+        """Remove a file; missing files are ignored."""
+        pass
+
+    def _record_write(self, name: str):
+        written = _written.get()
+        if written is not None:
+            written.setdefault(self.thread_id, set()).add(name)
+
+    async def read_text(self, name: str) -> str | None:
+        data = await self.read(name)
+        return None if data is None else data.decode("utf-8")
+
+    async def update_text(self, name: str, transform: Callable[[str], str]) -> str:
+        """
+        Replace a text file with `transform(current)` and return the new text.
+        Concurrent updates of the same thread apply one after another, so none
+        is lost; if `transform` raises, the file is left untouched.
+        """
+        async with self.lock:
+            current = await self.read_text(name)
+            if current is None:
+                raise FileNotFoundError(name)
+            updated = await asyncio.to_thread(transform, current)
+            await self.write(name, updated)
+            return updated
+
+
+class FileSystemWorkspace(Workspace):
+    def __init__(self, thread_id: str, directory: str, lock: asyncio.Lock | None = None):
+        super().__init__(thread_id, lock)
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        if not _SAFE_NAME.match(name) or ".." in name:
+            raise ValueError(f"Invalid workspace file name: {name!r}")
+        return os.path.join(self.directory, name)
+
+    async def read(self, name: str) -> bytes | None:
+        return await asyncio.to_thread(self._read, self.path(name))
+
+    async def write(self, name: str, data: bytes | str):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._record_write(name)
+        await asyncio.to_thread(self._write, self.path(name), data)
+
+    async def delete(self, name: str):
+        try:
+            await asyncio.to_thread(os.remove, self.path(name))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read(path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write next to the target and rename over it; the rename is atomic on
+        # POSIX and Windows, so a concurrent reader never sees a torn file.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class MemoryWorkspace(Workspace):
+    def __init__(self, thread_id: str):
+        super().__init__(thread_id)
+        self.files: dict[str, bytes] = {}
+
+    async def read(self, name: str) -> bytes | None:
+        return self.files.get(name)
+
+    async def write(self, name: str, data: bytes | str):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        # Swapping in a new bytes object is atomic as far as other tasks can tell.
+        self._record_write(name)
+        self.files[name] = data
+
+    async def delete(self, name: str):
+        self.files.pop(name, None)
+
+
+class WorkspaceStore:
+    """
+    Hands out one workspace per thread_id, either as a directory under
+    `directory` (the default) or held in memory when `backend` is "memory".
+    """
+
+    def __init__(self, backend: str | None = None, directory: str | None = None):
+        self.backend = (backend or os.getenv("WORKSPACE_BACKEND", "filesystem")).lower()
+        if self.backend not in ("filesystem", "memory"):
+            raise ValueError(f"Unknown workspace backend: {self.backend!r}")
+        self.directory = directory or os.getenv("WORKSPACE_DIR", ".cache/workspaces")
+        self._memory: dict[str, MemoryWorkspace] = {}
+        # One lock per live thread, dropped once no workspace refers to it
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def get(self, thread_id: str) -> Workspace:
+        if self.backend == "memory":
+            if thread_id not in self._memory:
+                self._memory[thread_id] = MemoryWorkspace(thread_id)
+            return self._memory[thread_id]
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        return FileSystemWorkspace(thread_id, os.path.join(self.directory, _safe_component(thread_id)), lock)
+
+    def discard(self, thread_id: str):
+        """Forget an in-memory workspace; directories on disk are left alone."""
+        self._memory.pop(thread_id, None)
+
+
+workspaces = WorkspaceStore()
+
+
+def get_workspace(config: RunnableConfig) -> Workspace:
+    """The workspace of the thread a graph run belongs to."""
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if not thread_id:
+        raise ValueError("A thread_id is required in the run config to locate the workspace")
+    return workspaces.get(thread_id)
@@ -1,14 +1,37 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
-import json
+from contextlib import aclosing, asynccontextmanager
+import mimetypes
+import asyncio
 import logging
 import time
+import uuid
+from urllib.parse import urlsplit
 
-from app.agents.react_agent.nodes import build_workflow
-from langgraph.checkpoint.memory import MemorySaver
+from app.agents.react_agent.nodes import build_workflow, is_clone_request
+from app.agents.utils.batch_clone import (
+    BATCH_CAPTURE_CONCURRENCY,
+    BATCH_GENERATION_CONCURRENCY,
+    BATCH_MAX_URLS,
+    run_batch,
+)
+from app.agents.utils.assets import asset_store, image_fetcher
+from app.agents.utils.browser_pool import browser_pool
+from app.agents.utils.cancellation import ClientDisconnected, cancelled_seconds, relay_until_disconnect, runs_cancelled
+from app.agents.utils.capture_prefetch import capture_prefetcher
+from app.agents.utils.checkpointer import CHECKPOINTER, active_threads, open_checkpointer
+from app.agents.utils.clone_pipeline import discard_partial_clones
+from app.agents.utils.llm_clients import close_llm_clients
+from app.agents.utils.metrics import CONTENT_TYPE, REGISTRY, Gauge, Histogram
+from app.agents.utils.lazy_scroll import ScrollPolicy
+from app.agents.utils.scheduler import QueueFull, capture_slots, llm_slots, scheduler
+from app.agents.utils.stream_events import STREAM_PROTOCOL_VERSION, encode_event, encode_graph_stream, encode_ndjson
+from app.agents.utils.tracing import end_trace, span, start_trace
+from app.agents.utils.workspace import record_writes, workspaces
 from langchain_core.messages import HumanMessage
 
 # Load environment variables
@@ -18,7 +41,35 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the browser pool so the first clone doesn't pay the browser launch
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        logger.warning(f"Browser pool warm-up failed, browsers will launch on demand: {e}")
+
+    # Conversation state lives in the configured checkpointer. Evicted
+    # in-memory threads also drop their in-memory workspace, if any.
+    async with open_checkpointer(on_evict=workspaces.discard) as checkpointer:
+        logger.info(f"Using the {CHECKPOINTER} checkpointer")
+        # Compile the graph once; per-thread state lives in the checkpointer
+        app.state.graph = build_workflow(checkpointer=checkpointer)
+        yield
+
+    await browser_pool.close()
+    await close_llm_clients()
+    await image_fetcher.close()
+
+app = FastAPI(lifespan=lifespan)
+
+request_seconds = Histogram("clone_request_duration_seconds", "Duration of streamed runs, queueing included", ("route",))
+Gauge("scheduler_running_runs", "Runs currently executing", callback=lambda: scheduler.running)
+Gauge("scheduler_queued_runs", "Runs waiting for admission", callback=lambda: scheduler.queued)
+Gauge("capture_slots_active", "Browser captures in progress", callback=lambda: capture_slots.active)
+Gauge("capture_slots_waiting", "Browser captures waiting for a slot", callback=lambda: capture_slots.waiting)
+Gauge("llm_slots_active", "LLM calls in progress", callback=lambda: llm_slots.active)
+Gauge("llm_slots_waiting", "LLM calls waiting for a slot", callback=lambda: llm_slots.waiting)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,62 +78,259 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Retry-After"],
 )
 
-# Use an in-memory checkpointer to maintain conversation state
-checkpointer = MemorySaver()
+class ScrollOverrides(BaseModel):
+    # Optional per-request overrides for the lazy-load scroll during captures,
+    # capped at the configured limits
+    max_scroll_seconds: float | None = Field(default=None, gt=0)
+    max_page_height: int | None = Field(default=None, gt=0)
 
-class ChatRequest(BaseModel):
+    def scroll_policy(self) -> ScrollPolicy:
+        policy = ScrollPolicy()
+        if self.max_scroll_seconds is not None:
+            policy.max_seconds = min(self.max_scroll_seconds, policy.max_seconds)
+        if self.max_page_height is not None:
+            policy.max_height = min(self.max_page_height, policy.max_height)
+        return policy
+
+class ChatRequest(ScrollOverrides):
     message: str
     thread_id: str
+    # False skips the LLM response cache for this request
+    llm_cache: bool = True
+
+class BatchCloneRequest(ScrollOverrides):
+    urls: list[str] = Field(min_length=1, max_length=BATCH_MAX_URLS)
+    # Clones land in the workspaces batch-<batch_id>-000, -001, ...
+    batch_id: str = Field(default_factory=lambda: uuid.uuid4().hex[:12], pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    # "ndjson" or "sse"
+    format: str = Field(default="ndjson", pattern="^(ndjson|sse)$")
+    # Optional per-request stage limits, capped at the configured ones
+    capture_concurrency: int | None = Field(default=None, ge=1)
+    generation_concurrency: int | None = Field(default=None, ge=1)
+    # False skips the LLM response cache for this batch
+    llm_cache: bool = True
 
-def pydantic_serializer(obj):
-    """Custom JSON serializer for Pydantic models."""
-    if isinstance(obj, BaseModel):
-        return obj.dict()
-    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+    @field_validator("urls")
+    @classmethod
+    def check_urls(cls, urls: list[str]) -> list[str]:
+        # Captures go straight to the browser, so only web pages: no file:, chrome: or data: URLs
+        for url in urls:
+            parts = urlsplit(url.strip())
+            if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+                raise ValueError(f"Only http(s) URLs can be cloned, not {url!r}")
+        return [url.strip() for url in urls]
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Orchids Website Cloning API"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage timings and payload sizes, request durations and pool occupancy."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/api/workspaces/{thread_id}/{name}")
+async def read_workspace_file(thread_id: str, name: str):
+    """Serve a file from a thread's workspace, e.g. the page.html preview."""
+    try:
+        data = await workspaces.get(thread_id).read(name)
+    except ValueError:
+        data = None
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "no-store"})
+
+@app.get("/api/assets/{name}")
+async def read_asset(name: str):
+    """Serve a downloaded image. Assets are content-addressed, so they never change."""
+    try:
+        data = await asset_store.read(name)
+    except ValueError:
+        data = None
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @app.post("/api/chat")
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
     request_id = f"req_{int(time.time())}"
     logger.info(f"[{request_id}] Received chat message for thread {req.thread_id}: {req.message}")
 
+    # Queue fairly per client; reject outright once the queue is full
+    client_id = request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+    try:
+        ticket = scheduler.admit(client_id)
+    except QueueFull as e:
+        logger.warning(f"[{request_id}] Rejected run for client {client_id}: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    async def run_events():
+        # Everything this run writes, so a cancelled run can clean up after itself
+        written = record_writes()
+        prefetches = []
+        # The in-memory checkpointer leaves the history and workspace of a running thread alone.
+        with active_threads.running(req.thread_id):
+            try:
+                with span("queue"):
+                    async for position in ticket.wait():
+                        yield encode_event({"t": "queued", "position": position})
+
+                # Start capturing the URLs of a clone request while the model thinks; edit turns
+                # never capture, and a queued run shouldn't take a browser.
+                if is_clone_request(req.message):
+                    prefetches = capture_prefetcher.start(req.thread_id, req.message, req.scroll_policy())
+
+                config = {"configurable": {"thread_id": req.thread_id, "scroll_policy": req.scroll_policy(), "llm_cache": req.llm_cache}}
+
+                message = HumanMessage(content=req.message)
+
+                # Stream the agent's execution
+                stream = app.state.graph.astream(
+                    {"messages": [message]}, 
+                    config=config,
+                    stream_mode=["updates", "messages", "custom"]
+                )
+
+                # Compact protocol events instead of raw LangGraph chunks
+                async for event in encode_graph_stream(stream, request_id, trace):
+                    yield event
+            except asyncio.CancelledError:
+                removed = await discard_partial_clones(written)
+                if removed:
+                    logger.info(f"[{request_id}] Removed partial artifacts of the cancelled run: {', '.join(removed)}")
+                raise
+            finally:
+                capture_prefetcher.discard(prefetches)
+
     async def response_generator():
+        started = time.perf_counter()
+        # "cancelled" unless the run gets to finish or fail on its own
+        outcome = "cancelled"
         try:
-            yield f"data: {json.dumps({'type': 'start', 'request_id': request_id})}\n\n"
-            
-            graph = build_workflow(checkpointer=checkpointer)
-            
-            config = {"configurable": {"thread_id": req.thread_id}}
-            
-            message = HumanMessage(content=req.message)
-
-            # Stream the agent's execution
-            stream = graph.stream(
-                {"messages": [message]}, 
-                config=config,
-                stream_mode=["updates", "messages"]
-            )
-
-            for chunk in stream:
-                logger.info(f"[{request_id}] Stream chunk: {chunk}")
-                
-                # We will simplify the complex chunk on the frontend
-                # For now, we pass the raw update chunk
-                yield f"data: {json.dumps({'type': 'update', 'data': chunk}, default=pydantic_serializer)}\n\n"
+            yield encode_event({"t": "start", "v": STREAM_PROTOCOL_VERSION, "request_id": request_id, "thread_id": req.thread_id})
 
+            # Stops the run, browser work and model calls included, as soon as the client goes away
+            async with aclosing(relay_until_disconnect(request.receive, run_events())) as events:
+                async for event in events:
+                    yield event
+            outcome = "completed"
+
+        except ClientDisconnected:
+            pass
         except Exception as e:
+            outcome = "error"
             logger.error(f"[{request_id}] Error during process: {e}", exc_info=True)
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+            yield encode_event({"t": "error", "error": str(e)})
         finally:
-            logger.info(f"[{request_id}] Process finished for thread {req.thread_id}.")
-            yield f"data: {json.dumps({'type': 'final', 'message': 'Process finished.'})}\n\n"
+            ticket.release()
+            end_trace()
+            elapsed = time.perf_counter() - started
+            request_seconds.observe(elapsed, route="chat")
+            elapsed_ms = round(elapsed * 1000)
+            if outcome == "cancelled":
+                runs_cancelled.inc(route="chat")
+                cancelled_seconds.inc(elapsed, route="chat")
+                logger.info(f"[{request_id}] Client disconnected; cancelled the run for thread {req.thread_id} after {elapsed_ms} ms.")
+            else:
+                logger.info(f"[{request_id}] Process finished for thread {req.thread_id} in {elapsed_ms} ms.")
+
+        # Nothing may be sent once the client is gone, so the last events go out here rather than in `finally`.
+        if outcome == "cancelled":
+            return
+        for event in trace.drain():
+            yield encode_event(event)
+        yield encode_event({"t": "final", "ms": elapsed_ms})
+
+    # Spans of this run, sent along as "timing" events
+    trace = start_trace()
+
+    # Releasing again after the response is a no-op, but covers a stream that never started
+    return StreamingResponse(response_generator(), media_type="text/event-stream", background=BackgroundTask(ticket.release))
+
+@app.post("/api/clone/batch")
+async def clone_batch(req: BatchCloneRequest, request: Request):
+    """Clone every URL directly, bypassing the agent, and stream per-URL progress and results."""
+    logger.info(f"[{req.batch_id}] Received batch of {len(req.urls)} URLs")
+
+    # The whole batch takes one slot in the scheduler
+    client_id = request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+    try:
+        ticket = scheduler.admit(client_id)
+    except QueueFull as e:
+        logger.warning(f"[{req.batch_id}] Rejected batch for client {client_id}: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    if req.format == "sse":
+        encode, media_type = encode_event, "text/event-stream"
+    else:
+        encode, media_type = encode_ndjson, "application/x-ndjson"
+
+    async def run_events():
+        async for position in ticket.wait():
+            yield {"t": "queued", "position": position}
+
+        async for event in run_batch(
+            req.urls,
+            req.batch_id,
+            capture_concurrency=min(req.capture_concurrency or BATCH_CAPTURE_CONCURRENCY, BATCH_CAPTURE_CONCURRENCY),
+            generation_concurrency=min(req.generation_concurrency or BATCH_GENERATION_CONCURRENCY, BATCH_GENERATION_CONCURRENCY),
+            scroll_policy=req.scroll_policy(),
+            use_llm_cache=req.llm_cache,
+        ):
+            yield event
+
+    async def response_generator():
+        started = time.perf_counter()
+        succeeded = failed = 0
+        outcome = "cancelled"
+        try:
+            yield encode({"t": "start", "v": STREAM_PROTOCOL_VERSION, "batch_id": req.batch_id, "count": len(req.urls)})
+
+            # A disconnect cancels every capture and generation still in flight
+            async with aclosing(relay_until_disconnect(request.receive, run_events())) as events:
+                async for event in events:
+                    if event["t"] == "result":
+                        succeeded += 1
+                    elif event["t"] == "url_error":
+                        failed += 1
+                    yield encode(event)
+            outcome = "completed"
+
+        except ClientDisconnected:
+            pass
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"[{req.batch_id}] Error during batch: {e}", exc_info=True)
+            yield encode({"t": "error", "error": str(e)})
+        finally:
+            ticket.release()
+            elapsed = time.perf_counter() - started
+            request_seconds.observe(elapsed, route="batch")
+            elapsed_ms = round(elapsed * 1000)
+            if outcome == "cancelled":
+                runs_cancelled.inc(route="batch")
+                cancelled_seconds.inc(elapsed, route="batch")
+                logger.info(f"[{req.batch_id}] Client disconnected; cancelled the batch after {elapsed_ms} ms with {succeeded} cloned.")
+            else:
+                logger.info(f"[{req.batch_id}] Batch finished in {elapsed_ms} ms: {succeeded} cloned, {failed} failed.")
+
+        if outcome != "cancelled":
+            yield encode({"t": "final", "ok": succeeded, "failed": failed, "ms": elapsed_ms})
 
-    return StreamingResponse(response_generator(), media_type="text/event-stream")
+    return StreamingResponse(response_generator(), media_type=media_type, background=BackgroundTask(ticket.release))
 
 if __name__ == "__main__":
     import uvicorn
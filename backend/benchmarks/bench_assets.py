@@ -0,0 +1,161 @@
+"""
+Run the image asset pipeline against a local HTTP fixture server: resolve a
+page's image sources, download them through the bounded pool into a scratch
+AssetStore and rewrite a generated page to use the local copies.
+
+Usage (from the backend directory):
+
+python -m benchmarks.bench_assets [--images 40] [--duplicates 10] [--latency-ms 50] [--concurrency 8]
+
+The fixture serves `--images` distinct PNGs, some of them larger than
+ASSET_MAX_DIMENSION, plus `--duplicates` URLs serving copies of them, one
+missing image and one HTML error page, each after `--latency-ms`. Sequential
+download time is roughly images x latency; the pool should divide it by the
+concurrency. Scaling the oversized images down is CPU-bound, so on a machine
+with few cores it takes a good share of the total.
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from app.agents.utils.assets import (
+    ASSET_MAX_DIMENSION,
+    ASSET_URL_PREFIX,
+    AssetStore,
+    ImageFetcher,
+    resolve_image_urls,
+    rewrite_image_sources,
+)
+
+
+def make_images(count: int) -> list[bytes]:
+    images = []
+    for index in range(count):
+        # Every fourth image is oversized and should come back scaled down.
+        size = (ASSET_MAX_DIMENSION * 2, 400) if index % 4 == 0 else (200, 120)
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (index * 37 % 256, index * 91 % 256, 128)).save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def start_fixture_server(images: list[bytes], duplicates: int, latency_ms: float) -> ThreadingHTTPServer:
+    routes = {f"/img/{index}.png": data for index, data in enumerate(images)}
+    routes.update({f"/copy/{index}.png": images[index % len(images)] for index in range(duplicates)})
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            if self.path == "/error.png":
+                body, content_type, status = b"<html>Oops</html>", "text/html", 200
+            elif self.path in routes:
+                body, content_type, status = routes[self.path], "image/png", 200
+            else:
+                body, content_type, status = b"", "text/plain", 404
+            self.server.requests += 1
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(args) -> int:
+    images = make_images(args.images)
+    server = start_fixture_server(images, args.duplicates, args.latency_ms)
+    base_url = f"http://127.0.0.1:{server.server_port}/page/index.html"
+
+    # Sources as a page would write them: relative, root-relative, absolute, repeated and data: URIs
+    sources = [f"../img/{index}.png" for index in range(args.images)]
+    sources += [f"/copy/{index}.png" for index in range(args.duplicates)]
+    sources += [f"http://127.0.0.1:{server.server_port}/img/0.png", "/missing.png", "/error.png", "data:image/gif;base64,R0lGOD"]
+    urls = resolve_image_urls(sources, base_url)
+    html = "<html><body>" + "".join(f'<img src="{source}" srcset="{source} 2x">' for source in sources) + "</body></html>"
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = AssetStore(directory)
+        fetcher = ImageFetcher(store, concurrency=args.concurrency)
+        try:
+            start = time.perf_counter()
+            assets = await fetcher.fetch_all(urls)
+            cold_ms = (time.perf_counter() - start) * 1000
+
+            requests_before = server.requests
+            start = time.perf_counter()
+            # Two pages of the same site fetching at once, after the first fetch
+            await asyncio.gather(fetcher.fetch_all(urls), fetcher.fetch_all(urls))
+            warm_ms = (time.perf_counter() - start) * 1000
+            repeat_requests = server.requests - requests_before
+        finally:
+            await fetcher.close()
+            server.shutdown()
+
+        start = time.perf_counter()
+        rewritten_html, rewritten = rewrite_image_sources(html, base_url, assets)
+        rewrite_ms = (time.perf_counter() - start) * 1000
+
+        stored = [name for name in os.listdir(directory) if not name.startswith(".")]
+        source_bytes = sum(len(data) for data in images)
+        stored_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in stored)
+        oversized = [name for name in stored if name.endswith(".webp")]
+        too_large = []
+        for name in oversized:
+            with Image.open(os.path.join(directory, name)) as image:
+                if max(image.size) > ASSET_MAX_DIMENSION:
+                    too_large.append(name)
+
+    print(f"Resolved {len(sources)} sources to {len(urls)} fetchable URLs")
+    print(f"Downloaded {len(assets)}/{len(urls)} in {cold_ms:.0f} ms (sequential would be ~{len(urls) * args.latency_ms:.0f} ms)")
+    print(f"Repeat fetch of the same URLs: {warm_ms:.1f} ms, {repeat_requests} request(s)")
+    print(f"Stored {len(stored)} files for {len(assets)} URLs, {stored_bytes / 1024:.0f} KB from {source_bytes / 1024:.0f} KB of originals")
+    print(f"Transcoded to WebP: {len(oversized)}")
+    print(f"Rewrote {rewritten} <img> tags in {rewrite_ms:.1f} ms; srcset left: {rewritten_html.count('srcset')}")
+
+    failed = False
+    if len(assets) != len(urls) - 2:
+        print("[!] Expected every URL but the missing image and the HTML page to download")
+        failed = True
+    if len(stored) != args.images:
+        print("[!] Duplicate images were stored more than once")
+        failed = True
+    # Only the two failed URLs may be tried again, once for both pages.
+    if repeat_requests > len(urls) - len(assets):
+        print("[!] Known URLs were downloaded again")
+        failed = True
+    if too_large:
+        print(f"[!] {len(too_large)} stored image(s) are still larger than {ASSET_MAX_DIMENSION}px")
+        failed = True
+    if rewritten_html.count(ASSET_URL_PREFIX) != rewritten:
+        print("[!] Rewritten sources don't point at the asset store")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--duplicates", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
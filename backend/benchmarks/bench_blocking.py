@@ -0,0 +1,119 @@
+"""
+Capture the fixture site's "embeds" page under each request-interception
+profile and compare what loaded: requests made and blocked, bytes loaded,
+which of the page's extras reached the server, and capture time.
+
+Usage (from the backend directory; needs Chromium, as for any capture):
+
+python -m benchmarks.bench_blocking [--runs 3] [--latency-ms 20] [--profiles off,fidelity,fast]
+
+The tracker stand-in host is added to a scratch blocklist file, loaded the
+same way as CAPTURE_BLOCKLIST. Expected: "fidelity" keeps the tracker script
+and pixel from loading, "fast" also blocks the font, the video and the
+third-party iframe, and every profile still produces a screenshot.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+
+from app.agents.utils import playwright_screenshot
+from app.agents.utils.browser_pool import browser_pool
+from app.agents.utils.playwright_screenshot import capture_page
+from app.agents.utils.request_blocking import PROFILES, RequestBlocker, load_blocklist
+from benchmarks.fixtures import TRACKER_HOST, FixtureSite
+
+_EXTRAS = {
+    "tracker": ("/vendor/analytics.js", "/vendor/pixel.gif"),
+    "font": ("/fonts/brand.woff2",),
+    "media": ("/media/clip.mp4",),
+    "third_party_frame": ("/widget/",),
+}
+
+# What each profile must keep from reaching the server
+_EXPECTED_BLOCKED = {
+    "off": set(),
+    "fidelity": {"tracker"},
+    "fast": {"tracker", "font", "media", "third_party_frame"},
+}
+
+
+async def capture_with(profile: str, blocklist, site: FixtureSite, runs: int, directory: str) -> dict:
+    playwright_screenshot.request_blocker = RequestBlocker(PROFILES[profile], blocklist)
+    timings, stats, reached = [], None, set()
+    for run in range(runs):
+        site.hits.clear()
+        image_path = os.path.join(directory, f"{profile}-{run}.png")
+        start = time.perf_counter()
+        result = await capture_page(site.url("embeds"), image_path)
+        timings.append((time.perf_counter() - start) * 1000)
+        stats = result.request_stats
+        reached = {name for name, paths in _EXTRAS.items() if any(site.hits.get(path) for path in paths)}
+        if not os.path.getsize(image_path):
+            raise RuntimeError(f"Empty screenshot under the {profile} profile")
+    return {"profile": profile, "ms": statistics.median(timings), "stats": stats, "reached": reached}
+
+
+async def run(args) -> int:
+    site = FixtureSite(latency_ms=args.latency_ms)
+    site.start()
+    with tempfile.TemporaryDirectory() as directory:
+        blocklist_path = os.path.join(directory, "blocklist.txt")
+        with open(blocklist_path, "w") as f:
+            f.write(f"# Stand-in tracker for the fixture site\n0.0.0.0 {TRACKER_HOST}\n")
+        blocklist = load_blocklist(blocklist_path)
+
+        await browser_pool.start()
+        try:
+            # Warm the browser so the first profile isn't charged for it.
+            await capture_with("off", blocklist, site, 1, directory)
+            results = [await capture_with(profile, blocklist, site, args.runs, directory) for profile in args.profiles]
+        finally:
+            await browser_pool.close()
+            site.stop()
+
+    baseline = next((result for result in results if result["profile"] == "off"), None)
+    print(f"{'profile':<10} {'requests':>8} {'blocked':>8} {'KB loaded':>10} {'KB saved':>9} {'p50 ms':>8}  reached the server")
+    for result in results:
+        stats = result["stats"]
+        saved = (baseline["stats"]["bytes_loaded"] - stats["bytes_loaded"]) / 1024 if baseline else 0
+        print(
+            f"{result['profile']:<10} {stats['requests']:>8} {stats['blocked']:>8} "
+            f"{stats['bytes_loaded'] / 1024:>10.0f} {saved:>9.0f} {result['ms']:>8.0f}  {', '.join(sorted(result['reached'])) or '-'}"
+        )
+        if stats["blocked_by_reason"]:
+            print(f"{'':<10} blocked: {stats['blocked_by_reason']}")
+
+    failed = False
+    for result in results:
+        expected = _EXPECTED_BLOCKED.get(result["profile"], set())
+        leaked = expected & result["reached"]
+        if leaked:
+            print(f"[!] {result['profile']}: {', '.join(sorted(leaked))} still reached the server")
+            failed = True
+        overblocked = (set(_EXTRAS) - expected) - result["reached"]
+        # The video may legitimately not be fetched until it plays.
+        overblocked.discard("media")
+        if overblocked:
+            print(f"[!] {result['profile']}: {', '.join(sorted(overblocked))} should have loaded")
+            failed = True
+    return 1 if failed else 0
+
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--profiles", type=lambda value: value.split(","), default=["off", "fidelity", "fast"])
+    args = parser.parse_args(argv)
+    unknown = [profile for profile in args.profiles if profile not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)}")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,406 @@
+"""
+End-to-end clone benchmark that runs offline: fixture pages from a local HTTP
+server go through the real Playwright capture, trim_html_for_llm, the graph
+and the /api/chat SSE endpoint, while the OpenAI models are replaced by a
+deterministic stub with configurable latency and canned responses.
+
+Usage (from the backend directory, with `playwright install chromium` done):
+
+python -m benchmarks.bench_e2e [--clients 4] [--runs 3] [--pages landing,article,catalog]
+                               [--assistant-latency-ms 800] [--clone-latency-ms 4000]
+                               [--site-latency-ms 20] [--out results.json] [--compare previous.json]
+
+Each client sends `--runs` clone requests one after another, all clients at
+once. Reported: p50/p95/p99 per stage (graph nodes, tools, time to first
+event, whole request), throughput, peak RSS of this process and of the whole
+process tree including Chromium, and the stub's call counts. Results are
+written as JSON (by default under .cache/benchmarks/, named after the commit)
+and `--compare` prints the change per stage against an earlier result file.
+"""
+import os
+import re
+import io
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import resource
+import contextlib
+import subprocess
+from types import SimpleNamespace
+from collections import defaultdict
+
+# Offline and isolated: local Chromium, in-memory state, no capture or LLM response cache.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["WORKSPACE_BACKEND"] = "memory"
+os.environ["CHECKPOINTER"] = "memory"
+os.environ.setdefault("CAPTURE_CACHE_TTL_SECONDS", "0")
+os.environ["LLM_CACHE_MODE"] = "off"
+for name in ("BROWSERLESS_API_TOKEN", "BROWSERLESS_WS_ENDPOINT"):
+    os.environ.pop(name, None)
+
+import httpx
+import orjson
+import uvicorn
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.main import app
+from app.agents.react_agent import nodes
+from app.agents.utils import clone_pipeline, context_compaction
+from app.agents.utils.context_compaction import CONTEXT_PROVIDER
+from benchmarks.fixtures import PAGES, FixtureSite
+
+CAPTURE_TOOL = nodes.get_screenshot_and_html_content_using_playwright.name
+CLONE_TOOL = nodes.clone_and_write_html_to_file.name
+_URL = re.compile(r"https?://\S+")
+
+CANNED_CLONE = """```html
+<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Clone</title>
+<style>
+body { margin: 0; font-family: Roboto, Arial, Helvetica, sans-serif; }
+header, footer { display: flex; justify-content: space-between; padding: 16px 48px; background: #0f172a; color: #fff; }
+main { display: grid; grid-template-columns: repeat(4, 1fr); gap: 24px; padding: 48px; }
+</style>
+</head>
+<body>
+<header><strong>Clone</strong><nav><a href="/landing/">Home</a></nav></header>
+<main>""" + "".join(f'<div><img src="/img/{i}.png" alt="Image {i}"><p>Card {i}</p></div>' for i in range(12)) + """</main>
+<footer><span>&copy; 2025</span></footer>
+</body>
+</html>
+```"""
+
+
+class StubStats:
+    def __init__(self):
+        self.assistant_calls = 0
+        self.clone_calls = 0
+        self.clone_prompt_chars = 0
+        self.clone_image_parts = 0
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Plays the assistant's part of a clone: capture the URL in the user's
+    message, then clone what the capture returned, then report back.
+    """
+
+    latency_ms: float = 0
+    stats: StubStats
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-stub"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages) -> AIMessage:
+        self.stats.assistant_calls += 1
+        last = next(m for m in reversed(messages) if m.name != CONTEXT_PROVIDER)
+        if isinstance(last, ToolMessage) and last.name == CAPTURE_TOOL:
+            try:
+                trimmed_html = json.loads(last.content)[0]
+            except (ValueError, KeyError, IndexError):
+                trimmed_html = str(last.content)
+            return AIMessage(content="", tool_calls=[{
+                "name": CLONE_TOOL, "args": {"trimmed_html_content": trimmed_html}, "id": f"call_{uuid.uuid4().hex[:12]}",
+            }])
+        if isinstance(last, HumanMessage) and (match := _URL.search(last.text())):
+            return AIMessage(content="", tool_calls=[{
+                "name": CAPTURE_TOOL, "args": {"url": match.group(0)}, "id": f"call_{uuid.uuid4().hex[:12]}",
+            }])
+        return AIMessage(content="The page has been cloned into page.html and page.css.")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+class StubOpenAI:
+    """Stands in for AsyncOpenAI in the clone call: waits, then returns CANNED_CLONE."""
+
+    def __init__(self, latency_ms: float, stats: StubStats):
+        self.latency_ms = latency_ms
+        self.stats = stats
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: list, **kwargs):
+        self.stats.clone_calls += 1
+        for part in messages[0]["content"]:
+            if part["type"] == "text":
+                self.stats.clone_prompt_chars += len(part["text"])
+            else:
+                self.stats.clone_image_parts += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=CANNED_CLONE))])
+
+
+def install_stubs(args, stats: StubStats):
+    chat_model = StubChatModel(latency_ms=args.assistant_latency_ms, stats=stats)
+    openai_client = StubOpenAI(args.clone_latency_ms, stats)
+    nodes.get_chat_model = lambda model: chat_model
+    context_compaction.get_chat_model = lambda model: chat_model
+    clone_pipeline.get_openai_client = lambda: openai_client
+
+
+def _rss_kb(pid: int | str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb() -> int | None:
+    """RSS of this process and all its descendants (Chromium included), or None off Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    children = defaultdict(list)
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name may contain spaces; the parent pid follows its closing parenthesis.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(pid))
+    total, stack = 0, [os.getpid()]
+    while stack:
+        pid = stack.pop()
+        total += _rss_kb(pid)
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+async def sample_rss(peak: dict, interval: float = 0.25):
+    while True:
+        rss = tree_rss_kb()
+        if rss is not None:
+            peak["tree_kb"] = max(peak.get("tree_kb", 0), rss)
+        await asyncio.sleep(interval)
+
+
+async def run_client(http: httpx.AsyncClient, client_index: int, urls: list[str], runs: int, results: dict):
+    for run in range(runs):
+        url = urls[(client_index + run) % len(urls)]
+        stages = defaultdict(list)
+        started = time.perf_counter()
+        first_event = None
+        error = None
+        async with http.stream(
+            "POST",
+            "/api/chat",
+            json={"message": f"Please clone {url}", "thread_id": f"bench-{client_index}-{run}-{uuid.uuid4().hex[:6]}"},
+            headers={"X-Client-Id": f"client-{client_index}"},
+        ) as response:
+            if response.status_code == 429:
+                results["rejected"] += 1
+                await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+                continue
+            buffer = b""
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                while b"\n\n" in buffer:
+                    frame, buffer = buffer.split(b"\n\n", 1)
+                    if not frame.startswith(b"data: "):
+                        continue
+                    event = orjson.loads(frame[6:])
+                    if first_event is None:
+                        first_event = time.perf_counter()
+                    kind = event.get("t")
+                    if kind == "stage":
+                        stages[f"node:{event['name']}"].append(event["ms"])
+                    elif kind == "tool_end":
+                        stages[f"tool:{event['name']}"].append(event["ms"])
+                        if event.get("status") == "error":
+                            error = f"{event['name']} failed"
+                    elif kind == "timing":
+                        stages[f"span:{event['name']}"].append(event["ms"])
+                    elif kind == "error":
+                        error = event.get("error")
+
+        finished = time.perf_counter()
+        stages["time_to_first_event"].append(((first_event or finished) - started) * 1000)
+        stages["request"].append((finished - started) * 1000)
+        for name, samples in stages.items():
+            results["stages"][name].extend(samples)
+        results["completed"] += 1
+        if error:
+            results["errors"].append(error)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 1),
+        "p95": round(percentile(samples, 95), 1),
+        "p99": round(percentile(samples, 99), 1),
+        "mean": round(sum(samples) / len(samples), 1),
+        "max": round(max(samples), 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    stats = StubStats()
+    install_stubs(args, stats)
+
+    site = FixtureSite(latency_ms=args.site_latency_ms)
+    site.start()
+    urls = [site.url(page) for page in args.pages]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    peak = {}
+    sampler = asyncio.create_task(sample_rss(peak))
+    results = {"stages": defaultdict(list), "errors": [], "rejected": 0, "completed": 0}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as http:
+            # One unmeasured clone so browser launch and first-use costs don't skew the numbers
+            if args.warmup:
+                await run_client(http, 0, urls[:1], 1, {"stages": defaultdict(list), "errors": [], "rejected": 0, "completed": 0})
+            started = time.perf_counter()
+            await asyncio.gather(*[run_client(http, client, urls, args.runs, results) for client in range(args.clients)])
+            wall_seconds = time.perf_counter() - started
+    finally:
+        sampler.cancel()
+        server.should_exit = True
+        await server_task
+        site.stop()
+
+    return {
+        "version": 1,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "completed": results["completed"],
+        "errors": results["errors"],
+        "rejected": results["rejected"],
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_per_minute": round(results["completed"] / wall_seconds * 60, 2),
+        "peak_rss_mb": {
+            "process": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "tree": round(peak["tree_kb"] / 1024, 1) if "tree_kb" in peak else None,
+        },
+        "stub": vars(stats),
+        "stages": {name: summarize(samples) for name, samples in sorted(results["stages"].items())},
+    }
+
+
+def print_report(report: dict):
+    print(f"{'stage':<58} {'n':>4} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<58} {stage['count']:>4} {stage['p50']:>7.0f}ms {stage['p95']:>7.0f}ms {stage['p99']:>7.0f}ms")
+    print(
+        f"\n{report['completed']} clones in {report['wall_seconds']} s "
+        f"({report['throughput_per_minute']}/min), {len(report['errors'])} failed, {report['rejected']} rejected with 429"
+    )
+    rss = report["peak_rss_mb"]
+    print(f"Peak RSS: {rss['process']} MB in this process" + (f", {rss['tree']} MB with its child processes (Chromium)" if rss["tree"] else ""))
+    stub = report["stub"]
+    print(f"Stub calls: {stub['assistant_calls']} assistant, {stub['clone_calls']} clone ({stub['clone_image_parts']} image parts)")
+    for error in sorted(set(report["errors"]))[:5]:
+        print(f"[!] {error}")
+
+
+def print_comparison(report: dict, previous: dict, threshold: float) -> bool:
+    """Print p50/p95 changes per stage; returns True if any slowed down by more than `threshold` percent."""
+    print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+    regressed = False
+    for name, stage in report["stages"].items():
+        before = previous["stages"].get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in ("p50", "p95"):
+            change = (stage[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key} {before[key]:.0f} -> {stage[key]:.0f}ms ({change:+.0f}%)")
+            if change > threshold and stage[key] - before[key] > 5:
+                regressed = True
+        print(f"  {name:<56} {'  '.join(changes)}")
+    before, after = previous["throughput_per_minute"], report["throughput_per_minute"]
+    print(f"  {'throughput':<56} {before}/min -> {after}/min")
+    return regressed
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3, help="clone requests per client")
+    parser.add_argument("--pages", type=lambda value: value.split(","), default=list(PAGES))
+    parser.add_argument("--assistant-latency-ms", type=float, default=800)
+    parser.add_argument("--clone-latency-ms", type=float, default=4000)
+    parser.add_argument("--site-latency-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's own output")
+    parser.add_argument("--out", help="where to write the JSON results")
+    parser.add_argument("--compare", help="an earlier JSON result to compare against")
+    parser.add_argument("--fail-over", type=float, default=20, help="exit 1 if a p50/p95 regressed by more than this percent")
+    args = parser.parse_args(argv)
+    unknown = set(args.pages) - set(PAGES)
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(sorted(unknown))}; choose from {', '.join(PAGES)}")
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        report = asyncio.run(run(args))
+    print_report(report)
+
+    out = args.out or os.path.join(".cache", "benchmarks", f"e2e-{report['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if print_comparison(report, json.load(f), args.fail_over):
+                print(f"[!] Some stages regressed by more than {args.fail_over:.0f}%")
+                return 1
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,119 @@
+"""
+Drive the run scheduler and the capture/LLM concurrency pools with fake stages
+(asyncio.sleep standing in for the browser and the model) to check admission,
+fairness and Retry-After behaviour without a browser or an API key.
+
+Usage (from the backend directory):
+
+python -m benchmarks.bench_scheduler [--clients 4] [--burst 12] [--max-running 4] [--max-queued 16]
+
+Client 0 sends `--burst` runs at once while the other clients send two each;
+with round-robin dispatch the light clients should not wait behind the burst.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+from app.agents.utils.scheduler import ConcurrencyPool, JobScheduler, QueueFull
+
+
+async def fake_run(
+    scheduler: JobScheduler,
+    capture_slots: ConcurrencyPool,
+    llm_slots: ConcurrencyPool,
+    client_id: str,
+    capture_seconds: float,
+    llm_seconds: float,
+    results: dict,
+):
+    submitted = time.perf_counter()
+    try:
+        ticket = scheduler.admit(client_id)
+    except QueueFull as e:
+        results["rejected"].append((client_id, e.retry_after))
+        return
+
+    positions = []
+    try:
+        async for position in ticket.wait():
+            positions.append(position)
+        started = time.perf_counter()
+        async with capture_slots:
+            results["peak_capture"] = max(results["peak_capture"], capture_slots.active)
+            await asyncio.sleep(capture_seconds)
+        async with llm_slots:
+            results["peak_llm"] = max(results["peak_llm"], llm_slots.active)
+            await asyncio.sleep(llm_seconds)
+    finally:
+        ticket.release()
+
+    results["order"].append(client_id)
+    results["runs"].append({
+        "client": client_id,
+        "queued_ms": (started - submitted) * 1000,
+        "total_ms": (time.perf_counter() - submitted) * 1000,
+        "positions": positions,
+    })
+
+
+async def simulate(args) -> dict:
+    scheduler = JobScheduler(
+        max_running=args.max_running,
+        max_queued=args.max_queued,
+        max_queued_per_client=args.max_queued_per_client,
+        expected_run_seconds=args.capture_seconds + args.llm_seconds,
+    )
+    capture_slots = ConcurrencyPool("capture", args.capture_concurrency)
+    llm_slots = ConcurrencyPool("llm", args.llm_concurrency)
+    results = {"runs": [], "rejected": [], "order": [], "peak_capture": 0, "peak_llm": 0}
+
+    runs = []
+    for client in range(args.clients):
+        for _ in range(args.burst if client == 0 else 2):
+            runs.append(fake_run(
+                scheduler, capture_slots, llm_slots, f"client-{client}",
+                args.capture_seconds, args.llm_seconds, results,
+            ))
+    await asyncio.gather(*runs)
+    return results
+
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=12)
+    parser.add_argument("--max-running", type=int, default=4)
+    parser.add_argument("--max-queued", type=int, default=16)
+    parser.add_argument("--max-queued-per-client", type=int, default=8)
+    parser.add_argument("--capture-concurrency", type=int, default=2)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--capture-seconds", type=float, default=0.2)
+    parser.add_argument("--llm-seconds", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(simulate(args))
+
+    print(f"{'client':<10} {'runs':>5} {'queued p50':>11} {'total p50':>10} {'total max':>10}")
+    for client in sorted({run["client"] for run in results["runs"]}):
+        runs = [run for run in results["runs"] if run["client"] == client]
+        print(
+            f"{client:<10} {len(runs):>5} {statistics.median(r['queued_ms'] for r in runs):>9.0f}ms "
+            f"{statistics.median(r['total_ms'] for r in runs):>8.0f}ms {max(r['total_ms'] for r in runs):>8.0f}ms"
+        )
+
+    print(f"\nCompletion order: {' '.join(client.split('-')[1] for client in results['order'])}")
+    print(f"Peak concurrent captures: {results['peak_capture']}/{args.capture_concurrency}, LLM calls: {results['peak_llm']}/{args.llm_concurrency}")
+    if results["rejected"]:
+        retry_afters = sorted({retry_after for _, retry_after in results["rejected"]})
+        print(f"Rejected with 429: {len(results['rejected'])} (Retry-After {retry_afters} s)")
+
+    if results["peak_capture"] > args.capture_concurrency or results["peak_llm"] > args.llm_concurrency:
+        print("[!] A concurrency pool exceeded its limit")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+"""
+Compare the streaming trim_html_for_llm against the BeautifulSoup implementation
+it replaced, on a corpus of saved pages (e.g. `page.content()` dumps).
+
+Usage (from the backend directory):
+
+python -m benchmarks.bench_trim_html path/to/corpus/ [more.html ...]
+
+Each argument is an .html file or a directory of them. With no arguments the
+pages in ../frontend/public are used.
+"""
+import os
+import sys
+import glob
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from app.agents.utils.trim_html import trim_html_for_llm
+
+
+def trim_html_for_llm_soup(html: str) -> str:
+    """The previous multi-pass implementation, kept as the reference output."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    for tag_name in ['script', 'meta', 'noscript', 'iframe', 'svg', 'canvas', 'video', 'audio', 'link', 'style']:
+        for tag in soup.find_all(tag_name):
+            tag.decompose()
+
+    # Only allow a minimal set of attributes
+    allowed_attrs = {"src", "href", "alt", "title"}
+
+    for tag in soup.find_all(True):
+        original_attributes = list(tag.attrs.keys())
+
+        for attr in original_attributes:
+            if attr not in allowed_attrs:
+                del tag[attr]
+
+    return str(soup)
+
+
+def measure(fn, html: str, repeat: int) -> tuple[str, float, int]:
+    """Return the output, the best wall time in ms and the peak traced memory in bytes."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(html)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, best * 1000, peak
+
+
+def collect(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.html"), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+
+def main(paths: list[str], repeat: int = 3):
+    files = collect(paths or ["../frontend/public"])
+    if not files:
+        print("[!] No .html files found")
+        return 1
+
+    print(f"{'page':<40} {'size':>9} {'soup ms':>9} {'stream ms':>10} {'speedup':>8} {'soup MB':>8} {'stream MB':>10}  match")
+    total_soup = total_stream = 0.0
+    mismatches = 0
+    for path in files:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+
+        expected, soup_ms, soup_peak = measure(trim_html_for_llm_soup, html, repeat)
+        actual, stream_ms, stream_peak = measure(trim_html_for_llm, html, repeat)
+        match = expected == actual
+        mismatches += not match
+        total_soup += soup_ms
+        total_stream += stream_ms
+
+        print(
+            f"{os.path.basename(path)[:40]:<40} {len(html) / 1024:>8.0f}K {soup_ms:>9.1f} {stream_ms:>10.1f} "
+            f"{soup_ms / max(stream_ms, 1e-6):>7.1f}x {soup_peak / 2**20:>8.1f} {stream_peak / 2**20:>10.1f}  {'yes' if match else 'NO'}"
+        )
+
+    print(f"\nTotal: soup {total_soup:.0f} ms, stream {total_stream:.0f} ms ({total_soup / max(total_stream, 1e-6):.1f}x)")
+    if mismatches:
+        print(f"[!] {mismatches} page(s) produced different output")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+"""
+Measure the fixed per-turn setup cost the chat endpoint used to pay (compiling
+the graph, constructing ChatOpenAI and AsyncOpenAI clients, binding tools)
+against the shared instances it uses now.
+
+Usage (from the backend directory):
+
+python -m benchmarks.bench_turn_overhead [--turns 200] [--url https://api.openai.com/v1/models]
+
+With --url, also time sequential GETs through a fresh httpx client per request
+versus the shared keep-alive pool, which shows what connection reuse saves in
+TCP/TLS handshakes. No API key is needed for either part.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from openai import AsyncOpenAI
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents.react_agent import nodes
+from app.agents.react_agent.nodes import build_workflow
+from app.agents.utils.llm_clients import close_llm_clients, get_http_client
+
+MODEL = "o4-mini-2025-04-16"
+
+
+def per_turn_setup_before(checkpointer):
+    build_workflow(checkpointer=checkpointer)
+    ChatOpenAI(model=MODEL).bind_tools(nodes.cloning_tools)
+    AsyncOpenAI()
+
+
+def per_turn_setup_after(checkpointer):
+    nodes._assistant_llm(True)
+    nodes.get_openai_client()
+
+
+def time_setup(fn, turns: int) -> list[float]:
+    checkpointer = MemorySaver()
+    samples = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        fn(checkpointer)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def time_requests(url: str, requests: int) -> tuple[list[float], list[float]]:
+    fresh = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            await client.get(url)
+        fresh.append((time.perf_counter() - start) * 1000)
+
+    pooled = []
+    client = get_http_client()
+    for _ in range(requests):
+        start = time.perf_counter()
+        await client.get(url)
+        pooled.append((time.perf_counter() - start) * 1000)
+    await close_llm_clients()
+    return fresh, pooled
+
+
+def summarize(label: str, samples: list[float]):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"{label:<28} mean {statistics.mean(samples):>8.2f} ms  p50 {statistics.median(samples):>8.2f} ms  p95 {p95:>8.2f} ms")
+
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--url", help="endpoint to time fresh vs pooled connections against")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"Per-turn setup over {args.turns} turns")
+    summarize("before (rebuilt per turn)", time_setup(per_turn_setup_before, args.turns))
+    summarize("after (shared)", time_setup(per_turn_setup_after, args.turns))
+
+    if args.url:
+        fresh, pooled = asyncio.run(time_requests(args.url, args.requests))
+        print(f"\nSequential GET {args.url} x{args.requests}")
+        summarize("fresh client per request", fresh)
+        summarize("shared keep-alive pool", pooled)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,219 @@
+"""
+A local fixture site for the benchmarks: a small, deterministic corpus of
+pages shaped like the ones people clone, served over HTTP from a background
+thread. Pages lazy-load some of their images as they scroll into view, carry
+the scripts, styles and tracking snippets that trim_html_for_llm strips, and
+reference images served by the same server.
+
+    site = FixtureSite(latency_ms=20)
+    site.start()
+    site.url("landing")   # http://127.0.0.1:<port>/landing/
+    site.stop()
+
+The "embeds" page also pulls in the heavy extras capture profiles block: a
+web font, a video and an iframe from THIRD_PARTY_HOST, and a tracker script
+and pixel from TRACKER_HOST. Both are stand-ins that reach the same server
+under other names; browsers resolve every *.localhost name to loopback.
+"""
+import io
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+_IMAGE_COUNT = 24
+
+_LAZY_SCRIPT = """
+<script>
+  // Swap in data-src once an image nears the viewport, like most lazy loaders
+  const observer = new IntersectionObserver(entries => {
+    for (const entry of entries) {
+      if (entry.isIntersecting) {
+        entry.target.src = entry.target.dataset.src;
+        observer.unobserve(entry.target);
+      }
+    }
+  }, {rootMargin: "200px"});
+  document.querySelectorAll("img[data-src]").forEach(img => observer.observe(img));
+</script>
+"""
+
+_TRACKING = """
+<script>window.dataLayer = window.dataLayer || []; dataLayer.push({event: "pageview"});</script>
+<noscript><img src="/pixel.gif" width="1" height="1" alt=""></noscript>
+"""
+
+_STYLE = """
+<style>
+  body { margin: 0; font-family: Arial, sans-serif; color: #1d2433; }
+  header, footer { display: flex; justify-content: space-between; padding: 16px 48px; background: #0f172a; color: white; }
+  nav a { color: inherit; margin-left: 24px; text-decoration: none; }
+  .hero { display: grid; grid-template-columns: 1fr 1fr; gap: 32px; padding: 64px 48px; background: #eef2ff; }
+  .grid { display: grid; grid-template-columns: repeat(4, 1fr); gap: 24px; padding: 48px; }
+  .card { border: 1px solid #e2e8f0; border-radius: 8px; padding: 16px; }
+  .card img, .hero img, article img { width: 100%; height: auto; }
+  article { max-width: 720px; margin: 48px auto; line-height: 1.6; }
+</style>
+"""
+
+_WORDS = (
+    "fast reliable simple modern secure open flexible scalable friendly clear "
+    "build ship design measure improve launch grow learn share support"
+).split()
+
+
+def _text(seed: int, words: int) -> str:
+    return " ".join(_WORDS[(seed * 7 + i * 3) % len(_WORDS)] for i in range(words)).capitalize() + "."
+
+
+def _image(index: int, lazy: bool) -> str:
+    src = f"/img/{index % _IMAGE_COUNT}.png"
+    if lazy:
+        return f'<img data-src="{src}" src="data:image/gif;base64,R0lGODlhAQABAAAAACw=" alt="Image {index}" width="400" height="240">'
+    return f'<img src="{src}" alt="Image {index}" width="400" height="240">'
+
+
+def _page(title: str, body: str) -> str:
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="preconnect" href="https://fonts.example">
+{_STYLE}
+{_TRACKING}
+</head>
+<body>
+<header><strong>{title}</strong><nav><a href="/landing/">Home</a><a href="/article/">Blog</a><a href="/catalog/">Shop</a></nav></header>
+{body}
+<footer><span>&copy; 2025 {title}</span><a href="/privacy">Privacy</a></footer>
+{_LAZY_SCRIPT}
+</body>
+</html>"""
+
+
+def landing_page() -> str:
+    cards = "".join(
+        f'<div class="card">{_image(i, lazy=i >= 4)}<h3>{_text(i, 3)}</h3><p>{_text(i + 1, 24)}</p><a href="/features/{i}">Learn more</a></div>'
+        for i in range(12)
+    )
+    return _page("Acme Cloud", f"""
+<section class="hero"><div><h1>{_text(1, 6)}</h1><p>{_text(2, 40)}</p><button>Get started</button></div>{_image(0, lazy=False)}</section>
+<section class="grid">{cards}</section>""")
+
+
+def article_page() -> str:
+    paragraphs = "".join(
+        (f"<p>{_text(i, 80)}</p>" + (f"<figure>{_image(i, lazy=True)}<figcaption>{_text(i, 8)}</figcaption></figure>" if i % 5 == 0 else ""))
+        for i in range(60)
+    )
+    return _page("Acme Blog", f"<article><h1>{_text(3, 9)}</h1>{paragraphs}</article>")
+
+
+def catalog_page() -> str:
+    products = "".join(
+        f'<div class="card">{_image(i, lazy=i >= 8)}<h3>{_text(i, 2)}</h3><p>${(i * 13) % 90 + 9}.99</p><button aria-label="Add {i} to cart">Add</button></div>'
+        for i in range(80)
+    )
+    return _page("Acme Store", f'<h1 style="padding: 0 48px">{_text(5, 4)}</h1><section class="grid">{products}</section>')
+
+
+THIRD_PARTY_HOST = "cdn.localhost"
+TRACKER_HOST = "tracker.localhost"
+
+
+def embeds_page(third_party: str, tracker: str) -> str:
+    """A page with fonts, media and an embed from `third_party`'s origin and tracking from `tracker`'s."""
+    return _page("Acme Media", f"""
+<style>
+  @font-face {{ font-family: Brand; src: url("{third_party}/fonts/brand.woff2") format("woff2"); }}
+  h1 {{ font-family: Brand, Arial, sans-serif; }}
+</style>
+<script src="{tracker}/vendor/analytics.js" async></script>
+<img src="{tracker}/vendor/pixel.gif" width="1" height="1" alt="">
+<section class="hero"><div><h1>{_text(7, 5)}</h1><p>{_text(8, 30)}</p></div>{_image(1, lazy=False)}</section>
+<section class="grid">
+  <video src="{third_party}/media/clip.mp4" width="640" height="360" preload="auto" muted></video>
+  <iframe src="{third_party}/widget/" width="400" height="300" title="Widget"></iframe>
+</section>""")
+
+
+# Payloads for the embeds page's extras, sized like the real thing
+_EXTRAS = {
+    "/fonts/brand.woff2": (b"wOF2" + bytes(60 * 1024), "font/woff2"),
+    "/media/clip.mp4": (bytes(2 * 1024 * 1024), "video/mp4"),
+    "/vendor/analytics.js": (b"/* analytics */" + b" " * 90 * 1024, "application/javascript"),
+    "/vendor/pixel.gif": (b"GIF89a", "image/gif"),
+    "/widget/": (b"<!DOCTYPE html><html><body><p>Third-party widget</p></body></html>", "text/html; charset=utf-8"),
+}
+
+PAGES = {
+    "landing": landing_page,
+    "article": article_page,
+    "catalog": catalog_page,
+}
+
+
+def _make_images() -> dict[str, bytes]:
+    images = {}
+    for index in range(_IMAGE_COUNT):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 480), (index * 37 % 256, index * 91 % 256, 160)).save(buffer, format="PNG")
+        images[f"/img/{index}.png"] = buffer.getvalue()
+    return images
+
+
+class FixtureSite:
+    """Serves PAGES and their images from 127.0.0.1, waiting `latency_ms` before each response."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.requests = 0
+        # Path -> number of requests for it
+        self.hits: dict[str, int] = {}
+        self.routes: dict[str, tuple[bytes, str]] = {
+            f"/{name}/": (render().encode("utf-8"), "text/html; charset=utf-8") for name, render in PAGES.items()
+        }
+        self.routes.update({path: (data, "image/png") for path, data in _make_images().items()})
+        self.routes.update(_EXTRAS)
+        self._server: ThreadingHTTPServer | None = None
+
+    def url(self, page: str = "") -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/{page}/" if page else f"http://127.0.0.1:{self._server.server_port}/"
+
+    def third_party_origin(self, host: str = THIRD_PARTY_HOST) -> str:
+        return f"http://{host}:{self._server.server_port}"
+
+    def start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if site.latency_ms:
+                    time.sleep(site.latency_ms / 1000)
+                site.requests += 1
+                path = self.path.split("?", 1)[0]
+                site.hits[path] = site.hits.get(path, 0) + 1
+                body, content_type = site.routes.get(path, (b"Not found", "text/plain"))
+                self.send_response(404 if content_type == "text/plain" else 200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.routes["/embeds/"] = (embeds_page(self.third_party_origin(), self.third_party_origin(TRACKER_HOST)).encode("utf-8"), "text/html; charset=utf-8")
+        threading.Thread(target=self._server.serve_forever, name="fixture-site", daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
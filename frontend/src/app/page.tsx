@@ -85,8 +85,9 @@ export default function Home() {
   }, [messages, currentStatus]);
 
   const refreshIframe = () => {
-    if (iframeRef.current) {
-        iframeRef.current.src = `/page.html?t=${new Date().getTime()}`;
+    if (iframeRef.current && threadId) {
+        // Each thread gets its own workspace on the backend
+        iframeRef.current.src = `http://localhost:8000/api/workspaces/${threadId}/page.html?t=${new Date().getTime()}`;
     }
   };
 
@@ -107,11 +108,16 @@ export default function Home() {
         body: JSON.stringify({ message: `clone ${inputValue}`, thread_id: threadId }),
       });
 
+      if (response.status === 429) {
+        const retryAfter = response.headers.get("Retry-After") ?? "a few";
+        throw new Error(`The server is busy, please try again in ${retryAfter} seconds.`);
+      }
       if (!response.body) throw new Error("Response body is null");
 
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       
+      let buffer = "";
       let looping = true;
       while (looping) {
         const { done, value } = await reader.read();
@@ -120,42 +126,39 @@ export default function Home() {
           break;
         }
 
-        const chunk = decoder.decode(value, { stream: true });
-        const eventLines = chunk.split("\n\n").filter(line => line.startsWith("data:"));
+        // Events can be split across reads; keep any incomplete tail for the next one
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop() ?? "";
+        const eventLines = frames.filter(line => line.startsWith("data:"));
 
         for (const line of eventLines) {
           try {
             const jsonStr = line.substring(5);
             if (!jsonStr) continue;
             
+            // Protocol v1 events, see backend/app/agents/utils/stream_events.py
             const parsedEvent = JSON.parse(jsonStr);
 
-            if (parsedEvent.type === 'update' && parsedEvent.data) {
-                const eventData = parsedEvent.data;
-                
-                if (eventData.agent) {
-                  // This is the "software_developer_assistant" thinking
-                   setCurrentStatus("Thinking...");
-                   const agentMessages = eventData.agent.messages;
-                   if (agentMessages && agentMessages.length > 0) {
-                     const lastMessage = agentMessages[agentMessages.length - 1];
-                     if(lastMessage.tool_calls && lastMessage.tool_calls.length > 0) {
-                         const toolName = lastMessage.tool_calls[0].name.replace(/_/g, ' ');
-                         setCurrentStatus(`Using tool: ${toolName}...`);
-                     }
-                   }
-                } else if (eventData.tools) {
-                    // This is the "tools" node running
-                    setCurrentStatus("Tool finished. Thinking...");
+            if (parsedEvent.t === 'queued') {
+                setCurrentStatus(`Waiting in queue (position ${parsedEvent.position})...`);
+            } else if (parsedEvent.t === 'delta') {
+                setCurrentStatus("Thinking...");
+            } else if (parsedEvent.t === 'tool_start') {
+                const toolName = parsedEvent.name.replace(/_/g, ' ');
+                setCurrentStatus(`Using tool: ${toolName}...`);
+            } else if (parsedEvent.t === 'tool_end') {
+                setCurrentStatus("Tool finished. Thinking...");
+            } else if (parsedEvent.t === 'artifact') {
+                if (parsedEvent.name === 'page.html' || parsedEvent.name === 'page.css') {
                     refreshIframe();
                 }
-
-            } else if (parsedEvent.type === 'final') {
+            } else if (parsedEvent.t === 'final') {
                 const finalMessage: Message = { id: uuidv4(), role: 'assistant', content: 'Cloning process complete.' };
                 setMessages(prev => [...prev, finalMessage]);
                 looping = false;
                 break;
-            } else if (parsedEvent.type === 'error') {
+            } else if (parsedEvent.t === 'error') {
                  const errorMessage: Message = { id: uuidv4(), role: 'assistant', content: `An error occurred: ${parsedEvent.error}` };
                  setMessages(prev => [...prev, errorMessage]);
                  looping = false;